@@ -3,28 +3,117 @@ Clinical API Endpoints - Johns Hopkins Standards
 Advanced clinical workflows and decision support
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional, Dict
+from redis.exceptions import RedisError
 from datetime import datetime, timedelta
+import asyncio
 import logging
+import operator
+import os
+import random
+import uuid
 
-from src.config.database import get_db
-from src.models.clinical import Patient, Encounter, Diagnosis, Order, Provider
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the kernels then run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+from src.config.database import AsyncSessionLocal, get_db, run_in_session, redis_client
+from src.models.clinical import Patient, Encounter, Diagnosis, Order, Provider, mrn_seq
 from src.schemas.clinical import (
     PatientCreate, PatientResponse, EncounterCreate, EncounterResponse,
     DiagnosisCreate, OrderCreate, VitalSigns, ClinicalAlert
 )
-from src.services.clinical_decision_support import ClinicalDecisionSupport
+from src.services.clinical_decision_support import ClinicalDecisionSupport, BULK_RISK_COLUMNS
 from src.services.quality_metrics import QualityMetrics
+from src.services.cache import cached, invalidate_keys, floor_to_minute
+from src.services.interoperability import ClinicalDataExchange
+from src.api.dependencies import get_cds, get_quality_metrics, get_data_exchange
 from src.auth.security import get_current_user
 
-router = APIRouter(prefix="/api/clinical", tags=["clinical"])
+router = APIRouter(prefix="/api/clinical", tags=["clinical"], default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 
+# Cache lifetimes in seconds
+SUMMARY_CACHE_TTL = 60
+DASHBOARD_CACHE_TTL = 300
+
+# MRN allocation: "sequence" (mrn_seq) or "random" where random identifiers
+# are a compliance requirement; random MRNs are checked against a Redis
+# Bloom filter of every issued MRN instead of querying patients
+MRN_STRATEGY = os.getenv("MRN_STRATEGY", "sequence")
+MRN_BLOOM_KEY = "mrn_bf"
+# Set once the filter holds every existing MRN; until then random MRNs are
+# checked against patients, as an empty filter would accept any of them
+MRN_BLOOM_SEEDED_KEY = "mrn_bf:seeded"
+MRN_BLOOM_LOAD_BATCH = 1000
+
+# Columns shown in the clinical summary lists; the wide narrative TEXT and
+# JSON result columns stay in the database
+_ENCOUNTER_LIST_COLUMNS = (
+    Encounter.id, Encounter.encounter_type, Encounter.status, Encounter.start_time,
+    Encounter.end_time, Encounter.department, Encounter.chief_complaint
+)
+_ORDER_LIST_COLUMNS = (
+    Order.id, Order.encounter_id, Order.order_type, Order.order_code, Order.description,
+    Order.priority, Order.status, Order.ordered_at, Order.result_status
+)
+
+# Critical value alerts (Johns Hopkins protocols), built once and shared
+_ALERT_HYPERTENSIVE_CRISIS = {
+    "type": "critical",
+    "message": "Hypertensive crisis - Systolic BP > 180",
+    "action_required": "Immediate physician notification"
+}
+_ALERT_TACHYCARDIA = {
+    "type": "warning",
+    "message": "Tachycardia - HR > 120",
+    "action_required": "Monitor closely"
+}
+_ALERT_HYPOXEMIA = {
+    "type": "critical",
+    "message": "Hypoxemia - O2 Sat < 90%",
+    "action_required": "Immediate intervention required"
+}
+_ALERT_FEVER = {
+    "type": "warning",
+    "message": "Fever - Temperature > 38.5°C",
+    "action_required": "Fever protocol"
+}
+
+# Single reading rules: (field, comparison, threshold, alert)
+_VITAL_SIGN_RULES = (
+    ("blood_pressure_systolic", operator.gt, 180, _ALERT_HYPERTENSIVE_CRISIS),
+    ("heart_rate", operator.gt, 120, _ALERT_TACHYCARDIA),
+    ("oxygen_saturation", operator.lt, 90, _ALERT_HYPOXEMIA),
+    ("temperature", operator.gt, 38.5, _ALERT_FEVER)
+)
+
+# Batch rules are evaluated by _vitals_mask, one bit per rule
+_HYPERTENSIVE_CRISIS = 1
+_TACHYCARDIA = 2
+_HYPOXEMIA = 4
+_FEVER = 8
+
+_VITAL_SIGN_ALERTS = (
+    (_HYPERTENSIVE_CRISIS, _ALERT_HYPERTENSIVE_CRISIS),
+    (_TACHYCARDIA, _ALERT_TACHYCARDIA),
+    (_HYPOXEMIA, _ALERT_HYPOXEMIA),
+    (_FEVER, _ALERT_FEVER)
+)
+
 @router.post("/patients", response_model=PatientResponse)
 async def create_patient(
     patient_data: PatientCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Create new patient with comprehensive validation"""
@@ -34,12 +123,12 @@ async def create_patient(
         
         patient = Patient(
             mrn=mrn,
-            **patient_data.dict()
+            **patient_data.model_dump()
         )
         
         db.add(patient)
-        db.commit()
-        db.refresh(patient)
+        await db.commit()
+        await db.refresh(patient)
         
         # Log patient creation for audit
         logger.info(f"Patient created: MRN {mrn} by user {current_user.id}")
@@ -50,36 +139,67 @@ async def create_patient(
         logger.error(f"Error creating patient: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create patient")
 
+@router.post("/patients/bulk")
+async def create_patients_bulk(
+    patients_data: List[PatientCreate],
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Create a batch of patients in a single transaction"""
+    if not patients_data:
+        return {"status": "success", "patients": []}
+    
+    try:
+        mrns = await generate_mrns(db, len(patients_data))
+        rows = [
+            {"mrn": mrn, **patient_data.model_dump()}
+            for mrn, patient_data in zip(mrns, patients_data)
+        ]
+        
+        created = (await db.execute(
+            insert(Patient).returning(Patient.id, Patient.mrn), rows
+        )).all()
+        await db.commit()
+        
+        logger.info(f"Bulk patient import: {len(created)} patients by user {current_user.id}")
+        
+        return {
+            "status": "success",
+            "patients": [{"id": patient_id, "mrn": mrn} for patient_id, mrn in created]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error creating patients in bulk: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to create patients")
+
 @router.get("/patients/{patient_id}/clinical-summary")
 async def get_clinical_summary(
     patient_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    cds: ClinicalDecisionSupport = Depends(get_cds),
     current_user = Depends(get_current_user)
 ):
     """Get comprehensive clinical summary for patient"""
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    return await cached(
+        f"csum:{patient_id}", SUMMARY_CACHE_TTL,
+        lambda: _build_clinical_summary(patient_id, db, cds)
+    )
+
+async def _build_clinical_summary(patient_id: str, db: AsyncSession, cds: ClinicalDecisionSupport) -> dict:
+    """Assemble the clinical summary from the database"""
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    # Get recent encounters
-    recent_encounters = db.query(Encounter).filter(
-        Encounter.patient_id == patient_id
-    ).order_by(Encounter.start_time.desc()).limit(10).all()
-    
-    # Get active diagnoses
-    active_diagnoses = db.query(Diagnosis).join(Encounter).filter(
-        Encounter.patient_id == patient_id,
-        Diagnosis.status == "active"
-    ).all()
-    
-    # Get recent orders
-    recent_orders = db.query(Order).filter(
-        Order.patient_id == patient_id
-    ).order_by(Order.ordered_at.desc()).limit(20).all()
-    
-    # Clinical decision support alerts
-    cds = ClinicalDecisionSupport()
-    alerts = await cds.get_patient_alerts(patient_id, db)
+    # The remaining lookups are independent, so run them concurrently;
+    # latency is bounded by the slowest query rather than their sum
+    recent_encounters, active_diagnoses, recent_orders, alerts, risk_scores = await asyncio.gather(
+        run_in_session(_get_recent_encounters, patient_id),
+        run_in_session(_get_active_diagnoses, patient_id),
+        run_in_session(_get_recent_orders, patient_id),
+        run_in_session(cds.get_patient_alerts, patient_id),
+        run_in_session(cds.calculate_risk_scores, patient_id)
+    )
     
     return {
         "patient": patient,
@@ -87,53 +207,122 @@ async def get_clinical_summary(
         "active_diagnoses": active_diagnoses,
         "recent_orders": recent_orders,
         "clinical_alerts": alerts,
-        "risk_scores": await cds.calculate_risk_scores(patient_id, db)
+        "risk_scores": risk_scores
+    }
+
+@router.get("/patients/bulk-summary")
+async def get_bulk_summary(
+    patient_ids: List[str] = Query(...),
+    db: AsyncSession = Depends(get_db),
+    cds: ClinicalDecisionSupport = Depends(get_cds),
+    current_user = Depends(get_current_user)
+):
+    """Vitals-based risk for a list of patients (e.g. a ward dashboard)"""
+    # Latest encounter per patient in one query
+    rows = (await db.execute(
+        select(
+            Encounter.patient_id,
+            Encounter.blood_pressure_systolic,
+            Encounter.respiratory_rate,
+            Encounter.oxygen_saturation
+        )
+        .where(Encounter.patient_id.in_(patient_ids))
+        .distinct(Encounter.patient_id)
+        .order_by(Encounter.patient_id, Encounter.start_time.desc())
+    )).all()
+    
+    if not rows:
+        return {"patients": []}
+    
+    # One float32 column per vital sign across all patients; None becomes NaN
+    ids, *columns = zip(*rows)
+    vitals = {
+        field: np.asarray(column, dtype=np.float32)
+        for field, column in zip(
+            ("blood_pressure_systolic", "respiratory_rate", "oxygen_saturation"), columns
+        )
+    }
+    scores = cds.bulk_risk_scores(vitals)
+    
+    return {
+        "patients": [
+            {"patient_id": patient_id, "risk_scores": dict(zip(BULK_RISK_COLUMNS, row))}
+            for patient_id, row in zip(ids, scores.tolist())
+        ]
     }
 
+@router.get("/patients/{patient_id}/fhir-summary")
+async def export_fhir_summary(
+    patient_id: str,
+    db: AsyncSession = Depends(get_db),
+    data_exchange: ClinicalDataExchange = Depends(get_data_exchange),
+    current_user = Depends(get_current_user)
+):
+    """Stream the patient's FHIR resources as NDJSON (bulk data format)"""
+    # Checked up front: once streaming has started a 404 can no longer be sent
+    if not await db.scalar(select(Patient.id).where(Patient.id == patient_id)):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    return StreamingResponse(
+        _stream_fhir_summary(data_exchange, patient_id),
+        media_type="application/fhir+ndjson"
+    )
+
 @router.post("/encounters", response_model=EncounterResponse)
 async def create_encounter(
     encounter_data: EncounterCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    cds: ClinicalDecisionSupport = Depends(get_cds),
     current_user = Depends(get_current_user)
 ):
     """Create new clinical encounter"""
     encounter = Encounter(
         provider_id=current_user.id,
-        **encounter_data.dict()
+        **encounter_data.model_dump()
     )
     
     db.add(encounter)
-    db.commit()
-    db.refresh(encounter)
+    await db.commit()
+    await db.refresh(encounter)
+    await invalidate_keys(f"csum:{encounter.patient_id}")
     
     # Trigger clinical decision support
-    cds = ClinicalDecisionSupport()
     await cds.evaluate_encounter(encounter.id, db)
     
     return encounter
 
+@router.post("/encounters/evaluate")
+async def evaluate_encounters(
+    encounter_ids: List[str],
+    db: AsyncSession = Depends(get_db),
+    cds: ClinicalDecisionSupport = Depends(get_cds),
+    current_user = Depends(get_current_user)
+):
+    """SIRS and NEWS2 for many encounters at once (e.g. an hourly ward sweep)"""
+    scores = await cds.evaluate_encounters_batch(encounter_ids, db) if encounter_ids else {}
+    return {"scores": {str(encounter_id): score for encounter_id, score in scores.items()}}
+
 @router.post("/encounters/{encounter_id}/vital-signs")
 async def record_vital_signs(
     encounter_id: str,
     vitals: VitalSigns,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Record vital signs with automated alerts"""
-    encounter = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+    encounter = await db.get(Encounter, encounter_id)
     if not encounter:
         raise HTTPException(status_code=404, detail="Encounter not found")
     
     # Update encounter with vital signs
-    for field, value in vitals.dict(exclude_unset=True).items():
+    for field, value in vitals.model_dump(exclude_unset=True).items():
         setattr(encounter, field, value)
     
-    # Calculate BMI if height and weight provided
-    if encounter.height and encounter.weight:
-        height_m = float(encounter.height) / 100  # Convert cm to meters
-        encounter.bmi = float(encounter.weight) / (height_m ** 2)
+    await db.commit()
+    await invalidate_keys(f"csum:{encounter.patient_id}")
     
-    db.commit()
+    # BMI is a generated column; reload the value Postgres computed
+    await db.refresh(encounter, ["bmi"])
     
     # Check for critical values
     alerts = await check_vital_signs_alerts(vitals, encounter.patient_id, db)
@@ -144,71 +333,220 @@ async def record_vital_signs(
         "bmi": encounter.bmi
     }
 
+@router.post("/encounters/vital-signs/bulk")
+async def record_vital_signs_bulk(
+    readings: Dict[str, VitalSigns],
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Record vital signs for many encounters (keyed by encounter id) in one transaction"""
+    if not readings:
+        return {"status": "success", "alerts": {}}
+    
+    # Compare parsed UUIDs, so any spelling of an id (case, hyphens) matches
+    try:
+        encounter_ids = {key: uuid.UUID(key) for key in readings}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid encounter id")
+    if len(set(encounter_ids.values())) != len(encounter_ids):
+        raise HTTPException(status_code=400, detail="Duplicate encounter ids")
+    
+    updates = {key: vitals.model_dump(exclude_unset=True) for key, vitals in readings.items()}
+    empty = [key for key, values in updates.items() if not values]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"No vital signs given for encounters: {', '.join(empty)}")
+    
+    patients_by_encounter = dict((await db.execute(
+        select(Encounter.id, Encounter.patient_id).where(Encounter.id.in_(list(encounter_ids.values())))
+    )).all())
+    missing = [key for key, encounter_id in encounter_ids.items() if encounter_id not in patients_by_encounter]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Encounters not found: {', '.join(missing)}")
+    
+    # Bulk UPDATE by primary key: one executemany instead of a flush per row
+    await db.execute(update(Encounter), [
+        {"id": encounter_ids[key], **values}
+        for key, values in updates.items()
+    ])
+    await db.commit()
+    
+    await invalidate_keys(*{f"csum:{patient_id}" for patient_id in patients_by_encounter.values()})
+    
+    alerts = check_vital_signs_alerts_batch(list(readings.values()))
+    
+    return {
+        "status": "success",
+        "alerts": dict(zip(readings, alerts))
+    }
+
 @router.get("/quality-metrics/dashboard")
 async def get_quality_dashboard(
     date_from: Optional[datetime] = Query(None),
     date_to: Optional[datetime] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    quality_service: QualityMetrics = Depends(get_quality_metrics),
     current_user = Depends(get_current_user)
 ):
     """Quality metrics dashboard - Johns Hopkins standards"""
+    now = floor_to_minute(datetime.now())
     if not date_from:
-        date_from = datetime.now() - timedelta(days=30)
+        date_from = now - timedelta(days=30)
     if not date_to:
-        date_to = datetime.now()
+        date_to = now
     
-    quality_service = QualityMetrics()
+    async def build_metrics():
+        return {
+            "patient_safety": await quality_service.get_safety_metrics(date_from, date_to, db),
+            "clinical_outcomes": await quality_service.get_outcome_metrics(date_from, date_to, db),
+            "efficiency": await quality_service.get_efficiency_metrics(date_from, date_to, db),
+            "satisfaction": await quality_service.get_satisfaction_metrics(date_from, date_to, db),
+            "compliance": await quality_service.get_compliance_metrics(date_from, date_to, db)
+        }
     
-    metrics = {
-        "patient_safety": await quality_service.get_safety_metrics(date_from, date_to, db),
-        "clinical_outcomes": await quality_service.get_outcome_metrics(date_from, date_to, db),
-        "efficiency": await quality_service.get_efficiency_metrics(date_from, date_to, db),
-        "satisfaction": await quality_service.get_satisfaction_metrics(date_from, date_to, db),
-        "compliance": await quality_service.get_compliance_metrics(date_from, date_to, db)
-    }
+    cache_key = f"qdash:clinical:{date_from.isoformat()}:{date_to.isoformat()}"
+    return await cached(cache_key, DASHBOARD_CACHE_TTL, build_metrics)
+
+async def _get_recent_encounters(patient_id: str, db: AsyncSession) -> List[dict]:
+    """Most recent encounters for the clinical summary"""
+    result = await db.execute(
+        select(*_ENCOUNTER_LIST_COLUMNS)
+        .where(Encounter.patient_id == patient_id)
+        .order_by(Encounter.start_time.desc())
+        .limit(10)
+    )
+    return [dict(row) for row in result.mappings()]
+
+async def _get_active_diagnoses(patient_id: str, db: AsyncSession) -> List[Diagnosis]:
+    """Active diagnoses across all of the patient's encounters"""
+    return (await db.scalars(
+        select(Diagnosis).join(Encounter).where(
+            Encounter.patient_id == patient_id,
+            Diagnosis.status == "active"
+        )
+    )).all()
+
+async def _get_recent_orders(patient_id: str, db: AsyncSession) -> List[dict]:
+    """Most recent orders for the clinical summary"""
+    result = await db.execute(
+        select(*_ORDER_LIST_COLUMNS)
+        .where(Order.patient_id == patient_id)
+        .order_by(Order.ordered_at.desc())
+        .limit(20)
+    )
+    return [dict(row) for row in result.mappings()]
+
+async def generate_mrn(db: AsyncSession) -> str:
+    """Generate unique Medical Record Number from the mrn_seq sequence"""
+    if MRN_STRATEGY == "random":
+        return await _generate_random_mrn(db)
     
-    return metrics
+    value = await db.scalar(select(mrn_seq.next_value()))
+    return f"MRN{value:06d}"
 
-async def generate_mrn(db: Session) -> str:
-    """Generate unique Medical Record Number"""
-    import random
+async def generate_mrns(db: AsyncSession, count: int) -> List[str]:
+    """Generate a batch of Medical Record Numbers in one round-trip"""
+    if MRN_STRATEGY == "random":
+        return [await _generate_random_mrn(db) for _ in range(count)]
+    
+    values = await db.scalars(
+        select(mrn_seq.next_value()).select_from(func.generate_series(1, count))
+    )
+    return [f"MRN{value:06d}" for value in values]
+
+async def _generate_random_mrn(db: AsyncSession) -> str:
+    """Generate a random MRN that has not been issued before"""
+    try:
+        use_filter = bool(await redis_client.exists(MRN_BLOOM_SEEDED_KEY))
+    except RedisError as e:
+        logger.warning(f"MRN Bloom filter unavailable, checking database: {str(e)}")
+        use_filter = False
+    
     while True:
         mrn = f"MRN{random.randint(100000, 999999)}"
-        existing = db.query(Patient).filter(Patient.mrn == mrn).first()
+        if use_filter:
+            try:
+                # BF.ADD is atomic and returns 0 when the MRN is (probably) taken;
+                # a false positive only costs another draw
+                if await redis_client.execute_command("BF.ADD", MRN_BLOOM_KEY, mrn):
+                    return mrn
+                continue
+            except RedisError as e:
+                logger.warning(f"MRN Bloom filter unavailable, checking database: {str(e)}")
+                use_filter = False
+        
+        existing = await db.scalar(select(Patient.id).where(Patient.mrn == mrn).limit(1))
         if not existing:
             return mrn
 
-async def check_vital_signs_alerts(vitals: VitalSigns, patient_id: str, db: Session) -> List[dict]:
+async def load_mrn_bloom_filter(db: AsyncSession):
+    """Seed the MRN Bloom filter with every issued MRN; started by the app lifespan
+    
+    A no-op once another worker (or an earlier start) has seeded it.
+    """
+    if await redis_client.exists(MRN_BLOOM_SEEDED_KEY):
+        return
+    
+    batch = []
+    async for mrn in await db.stream_scalars(select(Patient.mrn)):
+        batch.append(mrn)
+        if len(batch) == MRN_BLOOM_LOAD_BATCH:
+            await redis_client.execute_command("BF.MADD", MRN_BLOOM_KEY, *batch)
+            batch = []
+    if batch:
+        await redis_client.execute_command("BF.MADD", MRN_BLOOM_KEY, *batch)
+    await redis_client.set(MRN_BLOOM_SEEDED_KEY, 1)
+
+async def check_vital_signs_alerts(vitals: VitalSigns, patient_id: str, db: AsyncSession) -> List[dict]:
     """Check vital signs for critical values"""
-    alerts = []
-    
-    # Critical value thresholds (Johns Hopkins protocols)
-    if vitals.blood_pressure_systolic and vitals.blood_pressure_systolic > 180:
-        alerts.append({
-            "type": "critical",
-            "message": "Hypertensive crisis - Systolic BP > 180",
-            "action_required": "Immediate physician notification"
-        })
-    
-    if vitals.heart_rate and vitals.heart_rate > 120:
-        alerts.append({
-            "type": "warning",
-            "message": "Tachycardia - HR > 120",
-            "action_required": "Monitor closely"
-        })
-    
-    if vitals.oxygen_saturation and vitals.oxygen_saturation < 90:
-        alerts.append({
-            "type": "critical",
-            "message": "Hypoxemia - O2 Sat < 90%",
-            "action_required": "Immediate intervention required"
-        })
-    
-    if vitals.temperature and vitals.temperature > 38.5:
-        alerts.append({
-            "type": "warning",
-            "message": "Fever - Temperature > 38.5°C",
-            "action_required": "Fever protocol"
-        })
-    
-    return alerts
\ No newline at end of file
+    # Unset (or zero) vitals never raise an alert, matching the batch path
+    return [
+        alert for field, compare, threshold, alert in _VITAL_SIGN_RULES
+        if (value := getattr(vitals, field)) and compare(value, threshold)
+    ]
+
+def check_vital_signs_alerts_batch(readings: List[VitalSigns]) -> List[List[dict]]:
+    """Check a batch of vital sign readings for critical values in one pass"""
+    if not readings:
+        return []
+    
+    mask = _vitals_mask(
+        _vitals_column(readings, "blood_pressure_systolic"),
+        _vitals_column(readings, "heart_rate"),
+        _vitals_column(readings, "oxygen_saturation"),
+        _vitals_column(readings, "temperature")
+    )
+    
+    # Only readings that tripped a rule pay for building alert lists
+    return [
+        [alert for flag, alert in _VITAL_SIGN_ALERTS if bits & flag] if bits else []
+        for bits in mask.tolist()
+    ]
+
+async def _stream_fhir_summary(data_exchange: ClinicalDataExchange, patient_id: str) -> AsyncIterator[bytes]:
+    """NDJSON patient summary on a session held for as long as the client reads"""
+    async with AsyncSessionLocal() as db:
+        async for chunk in data_exchange.stream_patient_summary_ndjson(patient_id, db):
+            yield chunk
+
+def _vitals_column(readings: List[VitalSigns], field: str) -> np.ndarray:
+    """Gather one vital sign across readings; unset values become NaN"""
+    return np.fromiter(
+        (float(value) if (value := getattr(reading, field)) else np.nan for reading in readings),
+        dtype=np.float32,
+        count=len(readings)
+    )
+
+@njit(cache=True)
+def _vitals_mask(systolic, heart_rate, oxygen_saturation, temperature):
+    """Bitmask of triggered critical value rules for each reading"""
+    # NaN compares false, so missing vitals never raise an alert. fastmath is
+    # deliberately off because it lets the compiler assume NaN never occurs.
+    mask = np.zeros(systolic.shape[0], dtype=np.uint8)
+    for i in range(systolic.shape[0]):
+        mask[i] = (
+            (systolic[i] > 180) * _HYPERTENSIVE_CRISIS
+            | (heart_rate[i] > 120) * _TACHYCARDIA
+            | (oxygen_saturation[i] < 90) * _HYPOXEMIA
+            | (temperature[i] > 38.5) * _FEVER
+        )
+    return mask
@@ -0,0 +1,24 @@
+"""
+Shared API Dependencies
+Process-wide service instances injected into route handlers
+"""
+from functools import lru_cache
+
+from src.services.clinical_decision_support import ClinicalDecisionSupport
+from src.services.quality_metrics import QualityMetrics
+from src.services.interoperability import ClinicalDataExchange
+
+@lru_cache(maxsize=1)
+def get_cds() -> ClinicalDecisionSupport:
+    """Clinical decision support engine, built once per process"""
+    return ClinicalDecisionSupport()
+
+@lru_cache(maxsize=1)
+def get_quality_metrics() -> QualityMetrics:
+    """Quality metrics service, built once per process"""
+    return QualityMetrics()
+
+@lru_cache(maxsize=1)
+def get_data_exchange() -> ClinicalDataExchange:
+    """FHIR/HIE data exchange, built once per process so its HTTP pool is shared"""
+    return ClinicalDataExchange()
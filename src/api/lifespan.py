@@ -0,0 +1,56 @@
+"""
+Application Lifespan
+Process-wide background work started and stopped with the app;
+pass to FastAPI(lifespan=lifespan)
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import asyncio
+import logging
+
+from fastapi import FastAPI
+
+from src.api.clinical_api import MRN_STRATEGY, load_mrn_bloom_filter
+from src.api.dependencies import get_data_exchange
+from src.config.database import AsyncSessionLocal
+from src.models.partitions import ensure_monthly_partitions, maintain_partitions_periodically
+from src.models.quality_views import QUALITY_VIEW_REFRESH_INTERVAL, refresh_quality_views_periodically
+from src.services.security import AUDIT_BATCH_WRITES, audit_logger
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start background tasks on startup and stop them on shutdown"""
+    # Before serving, so this month's events land in their own partition
+    # rather than in DEFAULT, which would then block creating it
+    async with AsyncSessionLocal() as db:
+        await ensure_monthly_partitions(db)
+    
+    if AUDIT_BATCH_WRITES:
+        audit_logger.start()
+    tasks = [asyncio.create_task(maintain_partitions_periodically())]
+    if QUALITY_VIEW_REFRESH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(refresh_quality_views_periodically()))
+    if MRN_STRATEGY == "random":
+        # In the background: random MRNs are checked against patients until it is done
+        tasks.append(asyncio.create_task(_seed_mrn_bloom_filter()))
+    
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Pooled FHIR HTTP session and connector
+        await get_data_exchange().close()
+        # Last, so entries logged while shutting down are flushed too
+        await audit_logger.stop()
+
+async def _seed_mrn_bloom_filter():
+    """Load every issued MRN into the Bloom filter, logging rather than raising on failure"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await load_mrn_bloom_filter(db)
+    except Exception:
+        logger.exception("MRN Bloom filter seeding failed; random MRNs stay checked against patients")
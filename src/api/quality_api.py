@@ -3,53 +3,77 @@ Quality Management API
 Johns Hopkins Quality and Safety Standards
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
+import csv
+import io
 import logging
+import uuid
 
-from src.config.database import get_db
+from src.config.database import get_db, AsyncSessionLocal
 from src.services.quality_metrics import QualityMetrics
 from src.services.clinical_decision_support import ClinicalDecisionSupport
+from src.services.cache import cached, invalidate, floor_to_minute
+from src.api.dependencies import get_quality_metrics
+from src.models.quality_core import (
+    list_safety_events_fast, stream_rows, bulk_insert_safety_events, get_latest_measure_results
+)
+from src.models.quality_views import get_safety_event_trend, get_hai_device_rates
 from src.auth.security import get_current_user, require_permission
 
-router = APIRouter(prefix="/api/quality", tags=["quality"])
+router = APIRouter(prefix="/api/quality", tags=["quality"], default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 
+# Dashboard cache lifetime in seconds
+DASHBOARD_CACHE_TTL = 300
+
+# Maximum safety events returned per listing page
+SAFETY_EVENT_PAGE_SIZE = 100
+
 @router.get("/dashboard")
 @require_permission("quality:read")
 async def get_quality_dashboard(
     date_from: Optional[datetime] = Query(None),
     date_to: Optional[datetime] = Query(None),
     department: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    quality_service: QualityMetrics = Depends(get_quality_metrics),
     current_user = Depends(get_current_user)
 ):
     """Comprehensive quality metrics dashboard"""
+    now = floor_to_minute(datetime.now())
     if not date_from:
-        date_from = datetime.now() - timedelta(days=30)
+        date_from = now - timedelta(days=30)
     if not date_to:
-        date_to = datetime.now()
-    
-    quality_service = QualityMetrics()
+        date_to = now
     
-    dashboard_data = {
-        "overview": {
-            "reporting_period": {
-                "start": date_from.isoformat(),
-                "end": date_to.isoformat()
+    async def build_dashboard():
+        dashboard = {
+            "overview": {
+                "reporting_period": {
+                    "start": date_from.isoformat(),
+                    "end": date_to.isoformat()
+                },
+                "department": department or "All Departments"
             },
-            "department": department or "All Departments"
-        },
-        "patient_safety": await quality_service.get_safety_metrics(date_from, date_to, db, department),
-        "clinical_outcomes": await quality_service.get_outcome_metrics(date_from, date_to, db, department),
-        "efficiency": await quality_service.get_efficiency_metrics(date_from, date_to, db, department),
-        "satisfaction": await quality_service.get_satisfaction_metrics(date_from, date_to, db, department),
-        "compliance": await quality_service.get_compliance_metrics(date_from, date_to, db, department),
-        "benchmarks": await quality_service.get_benchmark_comparisons(date_from, date_to, db)
-    }
+            "patient_safety": await quality_service.get_safety_metrics(date_from, date_to, db, department),
+            "clinical_outcomes": await quality_service.get_outcome_metrics(date_from, date_to, db, department),
+            "efficiency": await quality_service.get_efficiency_metrics(date_from, date_to, db, department),
+            "satisfaction": await quality_service.get_satisfaction_metrics(date_from, date_to, db, department),
+            "compliance": await quality_service.get_compliance_metrics(date_from, date_to, db, department),
+            "benchmarks": await quality_service.get_benchmark_comparisons(date_from, date_to, db)
+        }
+        # The monthly rollup has no department breakdown
+        if not department:
+            dashboard["safety_event_trend"] = await get_safety_event_trend(date_from, date_to, db)
+        return dashboard
     
-    return dashboard_data
+    cache_key = f"qdash:{date_from.isoformat()}:{date_to.isoformat()}:{department}"
+    return await cached(cache_key, DASHBOARD_CACHE_TTL, build_dashboard)
 
 @router.get("/safety-events")
 @require_permission("quality:read")
@@ -58,31 +82,48 @@ async def get_safety_events(
     event_type: Optional[str] = Query(None),
     date_from: Optional[datetime] = Query(None),
     date_to: Optional[datetime] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Get patient safety events and incidents"""
-    from src.models.quality import SafetyEvent
+    """Get patient safety events and incidents, newest first, one page at a time"""
+    from src.models.quality import SafetyEvent, SAFETY_EVENT_SEVERITIES, SAFETY_EVENT_TYPES
+    
+    # Reject unknown values up front; Postgres would fail the enum cast instead
+    if severity and severity not in SAFETY_EVENT_SEVERITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid severity: {severity}")
+    if event_type and event_type not in SAFETY_EVENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid event type: {event_type}")
     
-    query = db.query(SafetyEvent)
+    filters = []
     
     if severity:
-        query = query.filter(SafetyEvent.severity == severity)
+        filters.append(SafetyEvent.severity == severity)
     if event_type:
-        query = query.filter(SafetyEvent.event_type == event_type)
+        filters.append(SafetyEvent.event_type == event_type)
     if date_from:
-        query = query.filter(SafetyEvent.occurred_at >= date_from)
+        filters.append(SafetyEvent.occurred_at >= date_from)
     if date_to:
-        query = query.filter(SafetyEvent.occurred_at <= date_to)
+        filters.append(SafetyEvent.occurred_at <= date_to)
+    
+    # Keyset pagination: resume strictly after the last row of the previous
+    # page; id breaks ties between identical timestamps
+    after = _decode_safety_event_cursor(cursor) if cursor else None
+    events = await list_safety_events_fast(db, filters, after, SAFETY_EVENT_PAGE_SIZE)
     
-    events = query.order_by(SafetyEvent.occurred_at.desc()).all()
+    next_cursor = None
+    if len(events) == SAFETY_EVENT_PAGE_SIZE:
+        next_cursor = f"{events[-1].occurred_at.isoformat()}|{events[-1].id}"
+    
+    by_severity, by_type = await _count_safety_events(filters, db)
     
     return {
-        "events": events,
+        "events": [event._asdict() for event in events],
+        "next_cursor": next_cursor,
         "summary": {
-            "total_events": len(events),
-            "by_severity": await _group_by_severity(events),
-            "by_type": await _group_by_type(events)
+            "total_events": sum(by_severity.values()),
+            "by_severity": by_severity,
+            "by_type": by_type
         }
     }
 
@@ -90,20 +131,39 @@ async def get_safety_events(
 @require_permission("quality:write")
 async def report_safety_event(
     event_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Report patient safety event"""
-    from src.models.quality import SafetyEvent
+    from src.models.quality import SafetyEvent, SafetyEventNumber
+    
+    if not event_data.get("event_number"):
+        raise HTTPException(status_code=422, detail="event_number is required")
     
     safety_event = SafetyEvent(
         reporter_id=current_user.id,
         **event_data
     )
     
+    # Registering the number in the same transaction keeps it unique across
+    # partitions, which the partitioned table's own constraint cannot do
+    db.add(SafetyEventNumber(
+        event_number=safety_event.event_number,
+        occurred_at=safety_event.occurred_at
+    ))
     db.add(safety_event)
-    db.commit()
-    db.refresh(safety_event)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if _violated_constraint(e) != "pk_safety_event_numbers":
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail=f"Safety event number already reported: {safety_event.event_number}"
+        )
+    await db.refresh(safety_event)
+    await invalidate("qdash:*")
     
     # Trigger immediate response for high-severity events
     if safety_event.severity in ["critical", "major"]:
@@ -113,22 +173,89 @@ async def report_safety_event(
     
     return {"status": "success", "event_id": safety_event.id}
 
+@router.post("/safety-events/bulk")
+@require_permission("quality:write")
+async def report_safety_events_bulk(
+    events_data: List[dict],
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Report a batch of safety events (e.g. from an incident feed) in one transaction"""
+    if not events_data:
+        return {"status": "success", "event_ids": []}
+    
+    # Events whose number was already reported are skipped, so a feed can
+    # safely be replayed
+    try:
+        created = await bulk_insert_safety_events(
+            db, [{"reporter_id": current_user.id, **event_data} for event_data in events_data]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    await db.commit()
+    await invalidate("qdash:*")
+    
+    for event in created:
+        if event.severity in ["critical", "major"]:
+            await _trigger_safety_response(event, db)
+    
+    logger.info(f"Safety events reported in bulk: {len(created)} by user {current_user.id}")
+    
+    return {"status": "success", "event_ids": [event.id for event in created]}
+
+@router.get("/exports/{dataset}")
+@require_permission("quality:read")
+async def export_quality_data(
+    dataset: str,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    current_user = Depends(get_current_user)
+):
+    """Stream safety events, medication errors or measure results as CSV"""
+    from src.models.quality import SafetyEvent, MedicationError, QualityMeasureResult
+    
+    exports = {
+        "safety-events": (SafetyEvent.list_view_columns, SafetyEvent.occurred_at),
+        "medication-errors": (MedicationError.list_view_columns, MedicationError.discovered_at),
+        "measure-results": (
+            tuple(QualityMeasureResult.__table__.columns),
+            QualityMeasureResult.reporting_period_end
+        )
+    }
+    if dataset not in exports:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {dataset}")
+    
+    columns, time_column = exports[dataset]
+    query = select(*columns).order_by(time_column)
+    if date_from:
+        query = query.where(time_column >= date_from)
+    if date_to:
+        query = query.where(time_column <= date_to)
+    
+    logger.info(f"Quality export {dataset} started by user {current_user.id}")
+    
+    return StreamingResponse(
+        _stream_csv(query, [column.name for column in columns]),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.csv"'}
+    )
+
 @router.get("/clinical-indicators")
 @require_permission("quality:read")
 async def get_clinical_indicators(
     indicator_type: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    quality_service: QualityMetrics = Depends(get_quality_metrics),
     current_user = Depends(get_current_user)
 ):
     """Get clinical quality indicators"""
-    quality_service = QualityMetrics()
-    
     indicators = {
         "core_measures": await quality_service.get_core_measures(db),
         "patient_safety_indicators": await quality_service.get_psi_metrics(db),
         "healthcare_acquired_conditions": await quality_service.get_hac_metrics(db),
         "readmission_rates": await quality_service.get_readmission_rates(db),
-        "mortality_rates": await quality_service.get_mortality_rates(db)
+        "mortality_rates": await quality_service.get_mortality_rates(db),
+        "measure_results": await get_latest_measure_results(db)
     }
     
     if indicator_type:
@@ -141,16 +268,16 @@ async def get_clinical_indicators(
 async def get_infection_control_metrics(
     date_from: Optional[datetime] = Query(None),
     date_to: Optional[datetime] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    quality_service: QualityMetrics = Depends(get_quality_metrics),
     current_user = Depends(get_current_user)
 ):
     """Infection control and prevention metrics"""
+    now = floor_to_minute(datetime.now())
     if not date_from:
-        date_from = datetime.now() - timedelta(days=30)
+        date_from = now - timedelta(days=30)
     if not date_to:
-        date_to = datetime.now()
-    
-    quality_service = QualityMetrics()
+        date_to = now
     
     infection_metrics = {
         "healthcare_acquired_infections": {
@@ -158,7 +285,8 @@ async def get_infection_control_metrics(
             "cauti_rate": await quality_service.calculate_cauti_rate(date_from, date_to, db),
             "ssi_rate": await quality_service.calculate_ssi_rate(date_from, date_to, db),
             "vap_rate": await quality_service.calculate_vap_rate(date_from, date_to, db),
-            "cdiff_rate": await quality_service.calculate_cdiff_rate(date_from, date_to, db)
+            "cdiff_rate": await quality_service.calculate_cdiff_rate(date_from, date_to, db),
+            "device_associated_rates": await get_hai_device_rates(date_from, date_to, db)
         },
         "antimicrobial_stewardship": {
             "antibiotic_usage": await quality_service.get_antibiotic_usage(date_from, date_to, db),
@@ -177,12 +305,11 @@ async def get_infection_control_metrics(
 @require_permission("quality:read")
 async def get_performance_improvement_data(
     focus_area: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    quality_service: QualityMetrics = Depends(get_quality_metrics),
     current_user = Depends(get_current_user)
 ):
     """Performance improvement and PDSA cycle data"""
-    quality_service = QualityMetrics()
-    
     improvement_data = {
         "active_initiatives": await quality_service.get_active_initiatives(db),
         "completed_projects": await quality_service.get_completed_projects(db),
@@ -202,7 +329,7 @@ async def get_performance_improvement_data(
 @require_permission("quality:write")
 async def create_quality_initiative(
     initiative_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Create new quality improvement initiative"""
@@ -214,30 +341,74 @@ async def create_quality_initiative(
     )
     
     db.add(initiative)
-    db.commit()
-    db.refresh(initiative)
+    await db.commit()
+    await db.refresh(initiative)
+    await invalidate("qdash:*")
     
     logger.info(f"Quality initiative created: {initiative.id} by user {current_user.id}")
     
     return {"status": "success", "initiative_id": initiative.id}
 
-async def _group_by_severity(events: List) -> Dict[str, int]:
-    """Group safety events by severity"""
-    severity_counts = {}
-    for event in events:
-        severity = event.severity
-        severity_counts[severity] = severity_counts.get(severity, 0) + 1
-    return severity_counts
-
-async def _group_by_type(events: List) -> Dict[str, int]:
-    """Group safety events by type"""
-    type_counts = {}
-    for event in events:
-        event_type = event.event_type
-        type_counts[event_type] = type_counts.get(event_type, 0) + 1
-    return type_counts
-
-async def _trigger_safety_response(safety_event, db: Session):
+def _violated_constraint(error: IntegrityError) -> Optional[str]:
+    """Name of the constraint behind an IntegrityError, from the driver's error"""
+    orig = error.orig
+    # psycopg exposes it on diag; asyncpg on the error SQLAlchemy wraps
+    diag = getattr(orig, "diag", None)
+    return (
+        getattr(diag, "constraint_name", None)
+        or getattr(orig, "constraint_name", None)
+        or getattr(orig.__cause__, "constraint_name", None)
+    )
+
+def _decode_safety_event_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Split a safety event page cursor into its (occurred_at, id) key"""
+    try:
+        occurred_at, event_id = cursor.split("|", 1)
+        return datetime.fromisoformat(occurred_at), uuid.UUID(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _count_safety_events(filters: List, db: AsyncSession) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Count safety events by severity and by type in a single GROUPING SETS query"""
+    from src.models.quality import SafetyEvent
+    
+    rows = await db.execute(
+        select(SafetyEvent.severity, SafetyEvent.event_type, func.count())
+        .where(*filters)
+        .group_by(func.grouping_sets(
+            tuple_(SafetyEvent.severity),
+            tuple_(SafetyEvent.event_type)
+        ))
+    )
+    
+    # Both columns are NOT NULL, so the NULL side identifies the grouping set
+    severity_counts, type_counts = {}, {}
+    for severity, event_type, count in rows:
+        if event_type is None:
+            severity_counts[severity] = count
+        else:
+            type_counts[event_type] = count
+    return severity_counts, type_counts
+
+async def _stream_csv(query, header: List[str]) -> AsyncIterator[str]:
+    """Render a query as CSV text, one streamed chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    
+    # The request session is closed once the handler returns, so the
+    # stream holds its own for as long as the client is reading
+    async with AsyncSessionLocal() as db:
+        async for rows in stream_rows(db, query):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+async def _trigger_safety_response(safety_event, db: AsyncSession):
     """Trigger immediate response for critical safety events"""
     # Implementation would include:
     # - Immediate notifications to safety team
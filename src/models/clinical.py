@@ -2,18 +2,23 @@
 Clinical Data Models - Johns Hopkins Standards
 Comprehensive patient care tracking and clinical decision support
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Decimal, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric, JSON, Sequence, Computed, Index, func, text
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from datetime import datetime
-import uuid
+from src.utils.uuid7 import uuid7
 from src.config.database import Base
 
+# Medical Record Numbers are drawn from a database sequence so allocation is a
+# single round-trip and cannot collide under concurrent registrations.
+mrn_seq = Sequence("mrn_seq", start=100000, metadata=Base.metadata)
+
 class Patient(Base):
     """Enhanced patient model with comprehensive demographics"""
     __tablename__ = "patients"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     mrn = Column(String(20), unique=True, nullable=False)  # Medical Record Number
     first_name = Column(String(100), nullable=False)
     last_name = Column(String(100), nullable=False)
@@ -58,12 +63,21 @@ class Patient(Base):
     encounters = relationship("Encounter", back_populates="patient")
     orders = relationship("Order", back_populates="patient")
     allergies_list = relationship("PatientAllergy", back_populates="patient")
+    
+    @hybrid_property
+    def age(self) -> float:
+        """Age in years; in queries, whole years, e.g. Patient.age >= 65"""
+        return (datetime.now() - self.date_of_birth).days / 365.25
+    
+    @age.expression
+    def age(cls):
+        return func.extract("year", func.age(cls.date_of_birth))
 
 class Encounter(Base):
     """Clinical encounters - visits, admissions, procedures"""
     __tablename__ = "encounters"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
     provider_id = Column(UUID(as_uuid=True), ForeignKey("providers.id"), nullable=False)
     
@@ -80,15 +94,19 @@ class Encounter(Base):
     assessment_plan = Column(Text)
     
     # Vital signs
-    temperature = Column(Decimal(4, 1))
+    temperature = Column(Numeric(4, 1))
     blood_pressure_systolic = Column(Integer)
     blood_pressure_diastolic = Column(Integer)
     heart_rate = Column(Integer)
     respiratory_rate = Column(Integer)
-    oxygen_saturation = Column(Decimal(5, 2))
-    weight = Column(Decimal(5, 2))
-    height = Column(Decimal(5, 2))
-    bmi = Column(Decimal(4, 1))
+    oxygen_saturation = Column(Numeric(5, 2))
+    weight = Column(Numeric(5, 2))
+    height = Column(Numeric(5, 2))
+    # Maintained by Postgres whenever height or weight change (height in cm)
+    bmi = Column(Numeric(4, 1), Computed(
+        "CASE WHEN height > 0 THEN weight / ((height / 100.0) * (height / 100.0)) END",
+        persisted=True
+    ))
     
     # Location
     department = Column(String(100))
@@ -108,7 +126,7 @@ class Diagnosis(Base):
     """ICD-10 coded diagnoses"""
     __tablename__ = "diagnoses"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     encounter_id = Column(UUID(as_uuid=True), ForeignKey("encounters.id"), nullable=False)
     
     icd10_code = Column(String(10), nullable=False)
@@ -130,7 +148,7 @@ class Order(Base):
     """Clinical orders - medications, labs, imaging, procedures"""
     __tablename__ = "orders"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
     encounter_id = Column(UUID(as_uuid=True), ForeignKey("encounters.id"))
     ordering_provider_id = Column(UUID(as_uuid=True), ForeignKey("providers.id"), nullable=False)
@@ -153,6 +171,17 @@ class Order(Base):
     results = Column(JSON)
     result_status = Column(String(20))  # normal, abnormal, critical
     
+    # Critical lab check: one seek per patient over the few critical
+    # results, newest first. The TEXT/JSON columns are read from the heap
+    # rather than INCLUDEd, where a large value would exceed the btree
+    # tuple size limit and fail the write
+    __table_args__ = (
+        Index(
+            "ix_order_crit_lab", patient_id, completed_at.desc(),
+            postgresql_where=text("order_type = 'lab' AND result_status = 'critical'")
+        ),
+    )
+    
     # Relationships
     patient = relationship("Patient", back_populates="orders")
     encounter = relationship("Encounter", back_populates="orders")
@@ -162,7 +191,7 @@ class Provider(Base):
     """Healthcare providers with credentials and specialties"""
     __tablename__ = "providers"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     npi = Column(String(10), unique=True)  # National Provider Identifier
     
     first_name = Column(String(100), nullable=False)
@@ -190,7 +219,7 @@ class PatientAllergy(Base):
     """Patient allergies and adverse reactions"""
     __tablename__ = "patient_allergies"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
     
     allergen = Column(String(200), nullable=False)
@@ -211,7 +240,7 @@ class ClinicalNote(Base):
     """Clinical documentation and notes"""
     __tablename__ = "clinical_notes"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     encounter_id = Column(UUID(as_uuid=True), ForeignKey("encounters.id"), nullable=False)
     author_id = Column(UUID(as_uuid=True), ForeignKey("providers.id"), nullable=False)
     
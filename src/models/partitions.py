@@ -0,0 +1,65 @@
+"""
+Event Table Partition Maintenance
+Monthly range partitions for the append-mostly quality event tables
+"""
+from datetime import datetime
+from typing import List
+import asyncio
+import logging
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.database import AsyncSessionLocal
+from src.models.quality import PARTITIONED_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Seconds between partition maintenance runs; months are created well ahead,
+# so a daily check is plenty
+PARTITION_MAINTENANCE_INTERVAL = 86400
+
+# Advisory lock key held while creating partitions, so workers starting
+# together do not race on the same CREATE TABLE
+_PARTITION_LOCK_KEY = 0x7061_7274
+
+def _month_start(year: int, month: int) -> datetime:
+    """First instant of a month, normalising month overflow into the year"""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+async def ensure_monthly_partitions(db: AsyncSession, months_ahead: int = 3) -> List[str]:
+    """Create the current and next months_ahead monthly partitions of every event table
+    
+    Run from a scheduled job well before each month starts. A partition cannot
+    be created once the DEFAULT partition already holds rows for its range.
+    """
+    await db.execute(select(func.pg_advisory_xact_lock(_PARTITION_LOCK_KEY)))
+    
+    today = datetime.utcnow()
+    created = []
+    
+    for model in PARTITIONED_TABLES:
+        table = model.__tablename__
+        for offset in range(months_ahead + 1):
+            start = _month_start(today.year, today.month + offset)
+            end = _month_start(today.year, today.month + offset + 1)
+            partition = f"{table}_y{start.year}m{start.month:02d}"
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created.append(partition)
+    
+    await db.commit()
+    return created
+
+async def maintain_partitions_periodically(interval: int = PARTITION_MAINTENANCE_INTERVAL):
+    """Re-run ensure_monthly_partitions every interval seconds until cancelled; started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await ensure_monthly_partitions(db)
+        except Exception:
+            logger.exception("Partition maintenance failed")
@@ -2,62 +2,122 @@
 Quality Management Models
 Johns Hopkins Quality and Safety Framework
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Decimal, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Numeric, Enum, Index, Computed, PrimaryKeyConstraint, UniqueConstraint
+from sqlalchemy import DDL, event, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
-from datetime import datetime
-import uuid
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from src.utils.uuid7 import uuid7
 from src.config.database import Base
 
+# Timestamps are filled in by Postgres, so inserts (bulk ones especially)
+# need not bind them; columns are timezone-naive UTC as before
+UTC_NOW = text("timezone('utc', now())")
+
+SAFETY_EVENT_SEVERITIES = ("minor", "moderate", "major", "critical")
+SAFETY_EVENT_TYPES = (
+    "medication_error", "fall", "infection", "pressure_injury",
+    "procedure_complication", "diagnostic_error", "equipment_failure", "other"
+)
+SAFETY_EVENT_STATUSES = ("reported", "investigating", "resolved", "closed")
+MEDICATION_ERROR_STAGES = ("prescribing", "transcribing", "dispensing", "administering")
+MEDICATION_ERROR_SEVERITIES = ("no_harm", "minor", "moderate", "major", "catastrophic")
+TREND_DIRECTIONS = ("improving", "declining", "stable")
+
 class SafetyEvent(Base):
     """Patient safety events and incidents"""
     __tablename__ = "safety_events"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    event_number = Column(String(20), unique=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    event_number = Column(String(20), nullable=False)
     
     # Event classification
-    event_type = Column(String(100), nullable=False)  # medication_error, fall, infection, etc.
+    event_type = Column(Enum(*SAFETY_EVENT_TYPES, name="safety_event_type_enum"), nullable=False)
     category = Column(String(50))  # patient_safety, quality, compliance
-    severity = Column(String(20), nullable=False)  # minor, moderate, major, critical
+    severity = Column(Enum(*SAFETY_EVENT_SEVERITIES, name="severity_enum"), nullable=False)
     
     # Event details
     description = Column(Text, nullable=False)
     location = Column(String(100))
-    occurred_at = Column(DateTime, nullable=False)
-    discovered_at = Column(DateTime, default=datetime.utcnow)
+    occurred_at = Column(DateTime, primary_key=True)  # partition key, so part of the key
+    discovered_at = Column(DateTime, server_default=UTC_NOW)
     
     # People involved
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"))
     reporter_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    involved_staff = Column(JSON)  # List of staff IDs involved
+    involved_staff = Column(JSONB)  # List of staff IDs involved
+    involved_staff_count = Column(Integer, Computed(
+        "CASE WHEN jsonb_typeof(involved_staff) = 'array' THEN jsonb_array_length(involved_staff) END",
+        persisted=True
+    ))
     
     # Analysis and response
     root_cause_analysis = Column(Text)
-    contributing_factors = Column(JSON)
-    corrective_actions = Column(JSON)
-    preventive_measures = Column(JSON)
+    contributing_factors = Column(JSONB)
+    corrective_actions = Column(JSONB)
+    preventive_measures = Column(JSONB)
     
     # Status tracking
-    status = Column(String(20), default="reported")  # reported, investigating, resolved, closed
+    status = Column(Enum(*SAFETY_EVENT_STATUSES, name="safety_event_status_enum"), default="reported")
     assigned_to = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     due_date = Column(DateTime)
     completed_at = Column(DateTime)
     
     # System fields
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    # Relationships
-    patient = relationship("Patient")
-    reporter = relationship("User", foreign_keys=[reporter_id])
-    assignee = relationship("User", foreign_keys=[assigned_to])
+    created_at = Column(DateTime, server_default=UTC_NOW)
+    updated_at = Column(DateTime, server_default=UTC_NOW)  # maintained by trg_safety_events_updated_at
+    
+    # Relationships; lazy="raise" so list paths must batch-load them
+    # explicitly (selectinload) instead of issuing one query per row
+    patient = relationship("Patient", lazy="raise")
+    reporter = relationship("User", foreign_keys=[reporter_id], lazy="raise")
+    assignee = relationship("User", foreign_keys=[assigned_to], lazy="raise")
+    
+    # Columns for list views; narrative text and JSONB analysis are only
+    # loaded when a single event is opened
+    list_view_columns = (
+        id, event_number, event_type, category, severity, location,
+        occurred_at, patient_id, status, assigned_to, due_date
+    )
+    
+    # Serves the dashboard filter (severity, type) already sorted newest first
+    __table_args__ = (
+        Index("ix_safety_events_sev_type_time", severity, event_type, occurred_at.desc()),
+        Index("ix_se_status_occurred", status, occurred_at),
+        Index("ix_se_severity_occurred", severity, occurred_at),
+        Index("ix_se_patient_occurred", patient_id, occurred_at),
+        Index("ix_se_contrib_gin", contributing_factors, postgresql_using="gin"),
+        # Unique constraints on a partitioned table must include the partition
+        # key, so this only rules out duplicates within one timestamp; global
+        # uniqueness of event_number is enforced by safety_event_numbers
+        UniqueConstraint("event_number", "occurred_at", name="uq_safety_events_event_number"),
+        # Open work queue: closed events are most rows and never listed this way
+        Index("ix_se_open", occurred_at, postgresql_where=text("status <> 'closed'")),
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
+
+class SafetyEventNumber(Base):
+    """Registry of issued safety event numbers
+    
+    Not partitioned, so its primary key keeps event numbers unique across
+    every partition of safety_events. Each event's number is registered in
+    the same transaction that inserts the event.
+    """
+    __tablename__ = "safety_event_numbers"
+    
+    event_number = Column(String(20))
+    occurred_at = Column(DateTime, nullable=False)  # locates the event's partition
+    created_at = Column(DateTime, server_default=UTC_NOW)
+    
+    # Named so a duplicate number can be told apart from other integrity errors
+    __table_args__ = (
+        PrimaryKeyConstraint(event_number, name="pk_safety_event_numbers"),
+    )
 
 class QualityInitiative(Base):
     """Quality improvement initiatives and PDSA cycles"""
     __tablename__ = "quality_initiatives"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     title = Column(String(200), nullable=False)
     description = Column(Text)
     
@@ -68,7 +128,7 @@ class QualityInitiative(Base):
     # PDSA cycle tracking
     current_phase = Column(String(20), default="plan")  # plan, do, study, act
     hypothesis = Column(Text)
-    measures = Column(JSON)  # Outcome, process, and balancing measures
+    measures = Column(JSONB)  # Outcome, process, and balancing measures
     
     # Timeline
     start_date = Column(DateTime, nullable=False)
@@ -77,31 +137,31 @@ class QualityInitiative(Base):
     
     # Team
     lead_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    team_members = Column(JSON)  # List of team member IDs
+    team_members = Column(JSONB)  # List of team member IDs
     sponsor_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     
     # Results
-    baseline_data = Column(JSON)
-    current_data = Column(JSON)
-    target_goals = Column(JSON)
+    baseline_data = Column(JSONB)
+    current_data = Column(JSONB)
+    target_goals = Column(JSONB)
     lessons_learned = Column(Text)
     
     # Status
     status = Column(String(20), default="active")  # active, on_hold, completed, cancelled
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     
     # Relationships
-    lead = relationship("User", foreign_keys=[lead_id])
-    sponsor = relationship("User", foreign_keys=[sponsor_id])
-    creator = relationship("User", foreign_keys=[created_by])
+    lead = relationship("User", foreign_keys=[lead_id], lazy="raise")
+    sponsor = relationship("User", foreign_keys=[sponsor_id], lazy="raise")
+    creator = relationship("User", foreign_keys=[created_by], lazy="raise")
 
 class QualityMeasure(Base):
     """Quality measures and indicators"""
     __tablename__ = "quality_measures"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     name = Column(String(200), nullable=False)
     description = Column(Text)
     
@@ -115,8 +175,8 @@ class QualityMeasure(Base):
     calculation_method = Column(Text)
     
     # Targets and benchmarks
-    target_value = Column(Decimal(10, 4))
-    benchmark_value = Column(Decimal(10, 4))
+    target_value = Column(Numeric(10, 4, asdecimal=False))
+    benchmark_value = Column(Numeric(10, 4, asdecimal=False))
     benchmark_source = Column(String(200))
     
     # Reporting
@@ -124,13 +184,13 @@ class QualityMeasure(Base):
     responsible_department = Column(String(100))
     
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
 
 class QualityMeasureResult(Base):
     """Quality measure results over time"""
     __tablename__ = "quality_measure_results"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     measure_id = Column(UUID(as_uuid=True), ForeignKey("quality_measures.id"), nullable=False)
     
     # Time period
@@ -140,29 +200,61 @@ class QualityMeasureResult(Base):
     # Results
     numerator = Column(Integer)
     denominator = Column(Integer)
-    rate = Column(Decimal(10, 4))
+    rate = Column(Numeric(10, 4, asdecimal=False), Computed(
+        "CASE WHEN denominator > 0 THEN numerator::numeric / denominator END",
+        persisted=True
+    ))
     
     # Context
     department = Column(String(100))
     unit = Column(String(100))
     population_size = Column(Integer)
     
-    # Analysis
-    variance_from_target = Column(Decimal(10, 4))
-    variance_from_benchmark = Column(Decimal(10, 4))
-    trend_direction = Column(String(20))  # improving, declining, stable
+    # Analysis; variances are filled in by trg_qmr_variance on write
+    variance_from_target = Column(Numeric(10, 4, asdecimal=False))
+    variance_from_benchmark = Column(Numeric(10, 4, asdecimal=False))
+    trend_direction = Column(Enum(*TREND_DIRECTIONS, name="trend_direction_enum"))
     
-    calculated_at = Column(DateTime, default=datetime.utcnow)
+    calculated_at = Column(DateTime, server_default=UTC_NOW)
     calculated_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     
     # Relationships
-    measure = relationship("QualityMeasure")
+    measure = relationship("QualityMeasure", lazy="raise")
+    
+    # Rate trends per measure and per department over reporting periods
+    __table_args__ = (
+        Index("ix_qmr_measure_period", measure_id, reporting_period_end),
+        Index("ix_qmr_dept_period", department, reporting_period_end),
+    )
+
+# Generated columns are not yet computed when BEFORE triggers run, so the
+# trigger derives the rate from numerator/denominator itself
+event.listen(QualityMeasureResult.__table__, "after_create", DDL("""
+    CREATE OR REPLACE FUNCTION quality_measure_result_variance() RETURNS trigger AS $$
+    DECLARE
+        result_rate numeric;
+    BEGIN
+        result_rate := CASE WHEN NEW.denominator > 0
+                            THEN NEW.numerator::numeric / NEW.denominator END;
+        SELECT result_rate - m.target_value, result_rate - m.benchmark_value
+          INTO NEW.variance_from_target, NEW.variance_from_benchmark
+          FROM quality_measures m
+         WHERE m.id = NEW.measure_id;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""))
+event.listen(QualityMeasureResult.__table__, "after_create", DDL("""
+    CREATE TRIGGER trg_qmr_variance
+    BEFORE INSERT OR UPDATE OF numerator, denominator, measure_id ON quality_measure_results
+    FOR EACH ROW EXECUTE FUNCTION quality_measure_result_variance()
+"""))
 
 class InfectionControlEvent(Base):
     """Healthcare-associated infection tracking"""
     __tablename__ = "infection_control_events"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
     encounter_id = Column(UUID(as_uuid=True), ForeignKey("encounters.id"))
     
@@ -177,7 +269,7 @@ class InfectionControlEvent(Base):
     
     # Timeline
     onset_date = Column(DateTime, nullable=False)
-    detection_date = Column(DateTime, default=datetime.utcnow)
+    detection_date = Column(DateTime, primary_key=True, server_default=UTC_NOW)  # partition key
     resolution_date = Column(DateTime)
     
     # Classification
@@ -189,25 +281,30 @@ class InfectionControlEvent(Base):
     isolation_type = Column(String(50))
     contact_tracing_completed = Column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     
     # Relationships
-    patient = relationship("Patient")
-    encounter = relationship("Encounter")
+    patient = relationship("Patient", lazy="raise")
+    encounter = relationship("Encounter", lazy="raise")
+    
+    __table_args__ = (
+        Index("ix_ice_unresolved", patient_id, onset_date, postgresql_where=text("resolution_date IS NULL")),
+        {"postgresql_partition_by": "RANGE (detection_date)"},
+    )
 
 class MedicationError(Base):
     """Medication errors and near misses"""
     __tablename__ = "medication_errors"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"))
     order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id"))
     
     # Error classification
     error_type = Column(String(100), nullable=False)  # wrong_drug, wrong_dose, wrong_patient, etc.
-    error_stage = Column(String(50))  # prescribing, transcribing, dispensing, administering
-    severity = Column(String(20))  # no_harm, minor, moderate, major, catastrophic
+    error_stage = Column(Enum(*MEDICATION_ERROR_STAGES, name="medication_error_stage_enum"))
+    severity = Column(Enum(*MEDICATION_ERROR_SEVERITIES, name="medication_error_severity_enum"))
     
     # Error details
     description = Column(Text, nullable=False)
@@ -216,9 +313,13 @@ class MedicationError(Base):
     actual_action = Column(Text)
     
     # Contributing factors
-    contributing_factors = Column(JSON)
-    system_factors = Column(JSON)
-    human_factors = Column(JSON)
+    contributing_factors = Column(JSONB)
+    # First listed factor, kept by Postgres so filters skip the JSONB decode
+    primary_contributing_factor = Column(String(100), Computed(
+        "contributing_factors->>0", persisted=True
+    ), index=True)
+    system_factors = Column(JSONB)
+    human_factors = Column(JSONB)
     
     # Outcome
     patient_outcome = Column(String(100))
@@ -227,22 +328,33 @@ class MedicationError(Base):
     
     # Reporting
     discovered_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    discovered_at = Column(DateTime, default=datetime.utcnow)
+    discovered_at = Column(DateTime, primary_key=True, server_default=UTC_NOW)  # partition key
     reported_to_pharmacy = Column(Boolean, default=False)
     reported_to_physician = Column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=UTC_NOW)
     
     # Relationships
-    patient = relationship("Patient")
-    order = relationship("Order")
-    discoverer = relationship("User")
+    patient = relationship("Patient", lazy="raise")
+    order = relationship("Order", lazy="raise")
+    discoverer = relationship("User", lazy="raise")
+    
+    list_view_columns = (
+        id, patient_id, order_id, error_type, error_stage, severity,
+        medication_involved, harm_occurred, discovered_at
+    )
+    
+    # Containment filters such as contributing_factors @> '["handoff"]'
+    __table_args__ = (
+        Index("ix_mederr_contrib_gin", contributing_factors, postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (discovered_at)"},
+    )
 
 class ClinicalAlert(Base):
     """Clinical decision support alerts"""
     __tablename__ = "clinical_alerts"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=False)
     encounter_id = Column(UUID(as_uuid=True), ForeignKey("encounters.id"))
     
@@ -253,9 +365,12 @@ class ClinicalAlert(Base):
     message = Column(Text, nullable=False)
     
     # Clinical context
-    triggering_data = Column(JSON)
-    clinical_context = Column(JSON)
-    recommended_actions = Column(JSON)
+    triggering_data = Column(JSONB)
+    triggering_rule_id = Column(String(64), Computed(
+        "triggering_data->>'rule_id'", persisted=True
+    ), index=True)
+    clinical_context = Column(JSONB)
+    recommended_actions = Column(JSONB)
     
     # Response tracking
     acknowledged_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
@@ -267,9 +382,43 @@ class ClinicalAlert(Base):
     status = Column(String(20), default="active")  # active, acknowledged, resolved, overridden
     expires_at = Column(DateTime)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, server_default=UTC_NOW)  # partition key
     
     # Relationships
-    patient = relationship("Patient")
-    encounter = relationship("Encounter")
-    acknowledger = relationship("User")
\ No newline at end of file
+    patient = relationship("Patient", lazy="raise")
+    encounter = relationship("Encounter", lazy="raise")
+    acknowledger = relationship("User", lazy="raise")
+    
+    list_view_columns = (
+        id, patient_id, encounter_id, alert_type, severity, title,
+        status, expires_at, created_at
+    )
+    
+    __table_args__ = (
+        Index("ix_alert_actions_gin", recommended_actions, postgresql_using="gin"),
+        Index("ix_ca_active", patient_id, created_at, postgresql_where=text("status = 'active'")),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+event.listen(SafetyEvent.__table__, "after_create", DDL("""
+    CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := timezone('utc', now());
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""))
+event.listen(SafetyEvent.__table__, "after_create", DDL("""
+    CREATE TRIGGER trg_safety_events_updated_at
+    BEFORE UPDATE ON safety_events
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at()
+"""))
+
+# Partitioned event tables; rows outside every monthly partition land in a
+# DEFAULT partition (see src/models/partitions.py for the monthly ones)
+PARTITIONED_TABLES = (SafetyEvent, MedicationError, InfectionControlEvent, ClinicalAlert)
+
+for _model in PARTITIONED_TABLES:
+    event.listen(_model.__table__, "after_create", DDL(
+        "CREATE TABLE IF NOT EXISTS %(table)s_default PARTITION OF %(table)s DEFAULT"
+    ))
@@ -0,0 +1,174 @@
+"""
+Quality Core Queries
+SQLAlchemy Core reads for list and export paths that do not need ORM entities
+"""
+from datetime import datetime
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import uuid
+
+from sqlalchemy import DateTime, Table, select, insert, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.quality import SafetyEvent, SafetyEventNumber, QualityMeasure
+from src.models.quality_views import QualityMeasureLatest
+from src.utils.uuid7 import uuid7
+
+safety_events_table = SafetyEvent.__table__
+safety_event_numbers_table = SafetyEventNumber.__table__
+quality_measures_table = QualityMeasure.__table__
+
+# Rows fetched per server-side cursor round-trip when streaming exports
+STREAM_CHUNK_SIZE = 5000
+
+# Seconds an in-process snapshot of the quality measure definitions is reused;
+# measures are not edited through this app, so an edit made elsewhere shows
+# up within this long
+QUALITY_MEASURE_CACHE_TTL = 300
+
+# (loaded_at, measures by id); quality measures are a small, rarely edited
+# reference table read alongside nearly every result
+_measure_snapshot: Optional[Tuple[float, Dict[uuid.UUID, Row]]] = None
+
+async def list_safety_events_fast(
+    db: AsyncSession,
+    filters: List,
+    after: Optional[Tuple[datetime, uuid.UUID]] = None,
+    limit: int = 100
+) -> List[Row]:
+    """Safety events newest first as plain rows, resuming after an (occurred_at, id) key
+    
+    Rows come straight from the driver; no identity map or instrumented
+    attributes are built for them.
+    """
+    c = safety_events_table.c
+    query = select(*SafetyEvent.list_view_columns).where(*filters)
+    if after:
+        query = query.where(tuple_(c.occurred_at, c.id) < tuple_(*after))
+    
+    result = await db.execute(query.order_by(c.occurred_at.desc(), c.id.desc()).limit(limit))
+    return result.all()
+
+async def stream_rows(db: AsyncSession, stmt: Select, chunk: int = STREAM_CHUNK_SIZE) -> AsyncIterator[List[Row]]:
+    """Run stmt on a server-side cursor and yield its rows chunk by chunk
+    
+    Memory stays bounded by one chunk however large the result is, and the
+    first rows are available before the query has finished.
+    """
+    result = await db.stream(stmt.execution_options(yield_per=chunk))
+    async for rows in result.partitions():
+        yield rows
+
+def _uniform_rows(table: Table, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copies of rows with the same keys each, ready for one executemany
+    
+    Raises ValueError for unknown columns or a missing required (NOT NULL,
+    no default) column. Other absent columns get their scalar default, the
+    current UTC time for server-stamped timestamps, or NULL. Ids are
+    assigned client-side.
+    """
+    columns = {column.name: column for column in table.c if column.computed is None}
+    required = [
+        name for name, column in columns.items()
+        if not column.nullable and column.default is None and column.server_default is None
+    ]
+    
+    keys = set().union(*rows)
+    unknown = keys - columns.keys()
+    if unknown:
+        raise ValueError(f"Unknown {table.name} columns: {', '.join(sorted(unknown))}")
+    for index, row in enumerate(rows):
+        missing = [name for name in required if row.get(name) is None]
+        if missing:
+            raise ValueError(f"{table.name} row {index} is missing {', '.join(missing)}")
+    
+    now = datetime.utcnow()
+    fill = {}
+    for name in keys - {"id"}:
+        column = columns[name]
+        if column.default is not None and column.default.is_scalar:
+            fill[name] = column.default.arg
+        elif column.server_default is not None and isinstance(column.type, DateTime):
+            fill[name] = now
+        else:
+            fill[name] = None
+    
+    return [{**fill, **row, "id": row.get("id") or uuid7()} for row in rows]
+
+async def bulk_insert_safety_events(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[Row]:
+    """Insert a batch of safety events given as plain column dicts, as one executemany
+    
+    Ingest is idempotent on event_number: numbers are first claimed in the
+    safety_event_numbers registry with ON CONFLICT DO NOTHING, and only
+    events whose number was newly claimed are inserted, so a replayed event
+    is skipped even if its occurred_at differs from the stored one. Returns
+    (id, severity, description) of the events actually inserted. Raises
+    ValueError for malformed rows (see _uniform_rows) before writing
+    anything. The caller owns the transaction.
+    """
+    if not rows:
+        return []
+    
+    rows = _uniform_rows(safety_events_table, rows)
+    claimed = set((await db.execute(
+        pg_insert(safety_event_numbers_table)
+        .on_conflict_do_nothing(index_elements=["event_number"])
+        .returning(safety_event_numbers_table.c.event_number),
+        [{"event_number": row["event_number"], "occurred_at": row["occurred_at"]} for row in rows]
+    )).scalars())
+    
+    # A number repeated within the batch is claimed once; keep its first event
+    new_rows = []
+    for row in rows:
+        if row["event_number"] in claimed:
+            claimed.discard(row["event_number"])
+            new_rows.append(row)
+    if not new_rows:
+        return []
+    
+    c = safety_events_table.c
+    result = await db.execute(
+        insert(safety_events_table).returning(c.id, c.severity, c.description),
+        new_rows
+    )
+    return result.all()
+
+async def get_quality_measures(db: AsyncSession) -> Dict[uuid.UUID, Row]:
+    """Active quality measures by id, reloaded at most every QUALITY_MEASURE_CACHE_TTL seconds"""
+    global _measure_snapshot
+    
+    if _measure_snapshot and time.monotonic() - _measure_snapshot[0] < QUALITY_MEASURE_CACHE_TTL:
+        return _measure_snapshot[1]
+    
+    result = await db.execute(
+        select(quality_measures_table).where(quality_measures_table.c.is_active == True)
+    )
+    measures = {row.id: row for row in result}
+    _measure_snapshot = (time.monotonic(), measures)
+    return measures
+
+async def get_latest_measure_results(db: AsyncSession) -> List[Dict[str, Any]]:
+    """Most recent result of every active measure alongside its name, target and benchmark
+    
+    Results come from the mv_quality_measure_latest rollup and definitions
+    from the cached snapshot, so no join against quality_measures is run.
+    """
+    measures = await get_quality_measures(db)
+    result = await db.execute(select(QualityMeasureLatest.__table__))
+    
+    latest = []
+    for row in result:
+        measure = measures.get(row.measure_id)
+        if measure is None:  # inactive or retired measure
+            continue
+        latest.append({
+            **row._asdict(),
+            "name": measure.name,
+            "category": measure.category,
+            "target_value": measure.target_value,
+            "benchmark_value": measure.benchmark_value
+        })
+    return latest
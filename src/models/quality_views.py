@@ -0,0 +1,155 @@
+"""
+Quality Dashboard Rollups
+Materialized views over the quality tables, refreshed on a schedule
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+import asyncio
+import logging
+import os
+
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, MetaData, DDL, event, func, select, text
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.database import AsyncSessionLocal, Base
+
+logger = logging.getLogger(__name__)
+
+# Seconds between refreshes of the rollups; 0 disables the background refresh
+# (e.g. when pg_cron owns it)
+QUALITY_VIEW_REFRESH_INTERVAL = int(os.getenv("QUALITY_VIEW_REFRESH_INTERVAL", "900"))
+
+# Advisory lock key held while refreshing, so only one worker refreshes at a time
+_REFRESH_LOCK_KEY = 0x6D76_7266
+
+# The view classes get their own metadata so create_all never emits CREATE
+# TABLE for them; the views themselves are created after the base tables
+ViewBase = declarative_base(metadata=MetaData())
+
+# name -> (defining query, columns of the unique index that
+# REFRESH MATERIALIZED VIEW CONCURRENTLY requires)
+QUALITY_VIEWS = {
+    "mv_safety_event_monthly": ("""
+        SELECT date_trunc('month', occurred_at) AS month,
+               severity,
+               COALESCE(status, 'reported') AS status,
+               count(*) AS event_count
+        FROM safety_events
+        GROUP BY 1, 2, 3
+    """, "month, severity, status"),
+    "mv_hai_device_rates": ("""
+        SELECT date_trunc('month', onset_date) AS month,
+               infection_type,
+               COALESCE(device_type, 'none') AS device_type,
+               count(*) AS infection_count,
+               COALESCE(sum(device_days), 0) AS device_days,
+               count(*) * 1000.0 / NULLIF(sum(device_days), 0) AS rate_per_1000_device_days
+        FROM infection_control_events
+        WHERE healthcare_associated
+        GROUP BY 1, 2, 3
+    """, "month, infection_type, device_type"),
+    "mv_quality_measure_latest": ("""
+        SELECT DISTINCT ON (measure_id)
+               measure_id, reporting_period_start, reporting_period_end,
+               numerator, denominator, rate, trend_direction, calculated_at
+        FROM quality_measure_results
+        ORDER BY measure_id, reporting_period_end DESC
+    """, "measure_id"),
+}
+
+for _name, (_query, _unique_columns) in QUALITY_VIEWS.items():
+    event.listen(Base.metadata, "after_create", DDL(
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {_name} AS {_query}"
+    ))
+    event.listen(Base.metadata, "after_create", DDL(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{_name} ON {_name} ({_unique_columns})"
+    ))
+    event.listen(Base.metadata, "before_drop", DDL(f"DROP MATERIALIZED VIEW IF EXISTS {_name}"))
+
+class SafetyEventMonthly(ViewBase):
+    """Safety event counts per month, severity and status"""
+    __tablename__ = "mv_safety_event_monthly"
+    __table_args__ = {"info": {"is_view": True}}
+    
+    month = Column(DateTime, primary_key=True)
+    severity = Column(String(20), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    event_count = Column(Integer)
+
+class HaiDeviceRate(ViewBase):
+    """Healthcare-associated infections per month, infection type and device"""
+    __tablename__ = "mv_hai_device_rates"
+    __table_args__ = {"info": {"is_view": True}}
+    
+    month = Column(DateTime, primary_key=True)
+    infection_type = Column(String(100), primary_key=True)
+    device_type = Column(String(100), primary_key=True)  # "none" when not device associated
+    infection_count = Column(Integer)
+    device_days = Column(Integer)
+    rate_per_1000_device_days = Column(Numeric(asdecimal=False))
+
+class QualityMeasureLatest(ViewBase):
+    """Most recent result of each quality measure"""
+    __tablename__ = "mv_quality_measure_latest"
+    __table_args__ = {"info": {"is_view": True}}
+    
+    measure_id = Column(UUID(as_uuid=True), primary_key=True)
+    reporting_period_start = Column(DateTime)
+    reporting_period_end = Column(DateTime)
+    numerator = Column(Integer)
+    denominator = Column(Integer)
+    rate = Column(Numeric(10, 4, asdecimal=False))
+    trend_direction = Column(String(20))
+    calculated_at = Column(DateTime)
+
+async def refresh_quality_views(db: AsyncSession, concurrently: bool = True) -> bool:
+    """Recompute every rollup; False if another worker is already refreshing
+    
+    CONCURRENTLY keeps the views readable during the refresh but needs the
+    views to have been populated once, which CREATE MATERIALIZED VIEW does.
+    """
+    if not await db.scalar(select(func.pg_try_advisory_xact_lock(_REFRESH_LOCK_KEY))):
+        await db.rollback()
+        return False
+    
+    mode = "CONCURRENTLY " if concurrently else ""
+    for name in QUALITY_VIEWS:
+        await db.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{name}"))
+    await db.commit()
+    return True
+
+async def refresh_quality_views_periodically(interval: int = QUALITY_VIEW_REFRESH_INTERVAL):
+    """Refresh the rollups every interval seconds until cancelled; started by the app lifespan"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await refresh_quality_views(db)
+        except Exception:
+            logger.exception("Quality view refresh failed")
+
+async def get_safety_event_trend(date_from: datetime, date_to: datetime, db: AsyncSession) -> List[Dict[str, Any]]:
+    """Monthly safety event counts by severity and status over a period, hospital-wide"""
+    result = await db.execute(
+        select(SafetyEventMonthly.__table__)
+        .where(
+            SafetyEventMonthly.month >= func.date_trunc("month", date_from),
+            SafetyEventMonthly.month <= date_to
+        )
+        .order_by(SafetyEventMonthly.month, SafetyEventMonthly.severity, SafetyEventMonthly.status)
+    )
+    return [row._asdict() for row in result]
+
+async def get_hai_device_rates(date_from: datetime, date_to: datetime, db: AsyncSession) -> List[Dict[str, Any]]:
+    """Monthly healthcare-associated infection rates per infection type and device over a period"""
+    result = await db.execute(
+        select(HaiDeviceRate.__table__)
+        .where(
+            HaiDeviceRate.month >= func.date_trunc("month", date_from),
+            HaiDeviceRate.month <= date_to
+        )
+        .order_by(HaiDeviceRate.month, HaiDeviceRate.infection_type, HaiDeviceRate.device_type)
+    )
+    return [row._asdict() for row in result]
@@ -0,0 +1,61 @@
+"""
+Response Caching Services
+Redis-backed read-through cache for expensive clinical and quality views
+"""
+from typing import Any, Awaitable, Callable
+from datetime import datetime
+import logging
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from src.config.database import redis_client
+
+logger = logging.getLogger(__name__)
+
+async def cached(key: str, ttl: int, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached value for key, computing and storing it on a miss"""
+    try:
+        raw = await redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {str(e)}")
+        raw = None
+    
+    if raw is not None:
+        return orjson.loads(raw)
+    
+    # Encode once so cache hits and misses return the same JSON-ready shape
+    value = jsonable_encoder(await coro_factory())
+    
+    try:
+        await redis_client.set(key, orjson.dumps(value), ex=ttl)
+    except RedisError as e:
+        logger.warning(f"Cache write failed for {key}: {str(e)}")
+    
+    return value
+
+def floor_to_minute(dt: datetime) -> datetime:
+    """Snap a timestamp to the minute so default "now" ranges share cache keys"""
+    return dt.replace(second=0, microsecond=0)
+
+async def invalidate_keys(*keys: str):
+    """Drop cached entries by exact key in one DEL, without scanning the keyspace"""
+    if not keys:
+        return
+    try:
+        await redis_client.delete(*keys)
+    except RedisError as e:
+        logger.warning(f"Cache invalidation failed for {', '.join(keys)}: {str(e)}")
+
+async def invalidate(pattern: str):
+    """Drop every cached entry whose key matches the glob pattern
+    
+    SCANs the whole keyspace; use invalidate_keys when the keys are known.
+    """
+    try:
+        keys = [key async for key in redis_client.scan_iter(match=pattern)]
+        if keys:
+            await redis_client.delete(*keys)
+    except RedisError as e:
+        logger.warning(f"Cache invalidation failed for {pattern}: {str(e)}")
@@ -3,100 +3,270 @@ Clinical Decision Support System
 Johns Hopkins Evidence-Based Medicine Integration
 """
 from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, raiseload, load_only
 from datetime import datetime, timedelta
+from bisect import bisect_left
 import asyncio
+import itertools
 import logging
+import re
 
+import numpy as np
+
+from src.config.database import run_in_session
 from src.models.clinical import Patient, Encounter, Diagnosis, Order
 from src.external.drug_interactions import DrugInteractionChecker
 from src.external.clinical_guidelines import GuidelineEngine
+from src.utils.async_cache import async_ttl_cache
 
 logger = logging.getLogger(__name__)
 
+# Guideline recommendations per ICD-10 code are effectively static
+GUIDELINE_CACHE_SIZE = 4096
+GUIDELINE_CACHE_TTL = 3600
+
+# Interaction results per medication set; short-lived so new interaction
+# data reaches stable patients polled by dashboards within minutes
+DRUG_INTERACTION_CACHE_SIZE = 10_000
+DRUG_INTERACTION_CACHE_TTL = 300
+
+# Column order of the matrix returned by ClinicalDecisionSupport.bulk_risk_scores
+BULK_RISK_COLUMNS = ("sepsis_risk", "critical_vitals")
+
+# Vitals scored by ClinicalDecisionSupport.evaluate_encounters_batch
+BATCH_VITAL_COLUMNS = ("temperature", "heart_rate", "respiratory_rate", "oxygen_saturation", "blood_pressure_systolic")
+
+# NEWS2 bands per vital: (field, inclusive upper bounds, points per band).
+# bisect_left gives the index of the first bound >= value, so a value equal
+# to a bound stays in the lower band. Respiratory rate, heart rate and
+# systolic pressure are integers and temperature has one decimal, so e.g.
+# "rr >= 21" is the band above 20 and "temp >= 38.1" the band above 38.0.
+_NEWS2_BANDS = (
+    ("respiratory_rate", (8, 11, 20, 24), (3, 1, 0, 2, 3)),
+    ("oxygen_saturation", (91, 93, 95), (3, 2, 1, 0)),
+    ("blood_pressure_systolic", (90, 100, 110, 219), (3, 2, 1, 0, 3)),
+    ("heart_rate", (40, 50, 90, 110, 130), (3, 1, 0, 1, 2, 3)),
+    ("temperature", (35.0, 38.0, 39.0), (3, 0, 1, 2)),
+)
+
+# Diagnosis keyword sets, matched once per description without lower-casing
+_FALL_RE = re.compile(r"fall", re.IGNORECASE)
+_MOBILITY_RE = re.compile(r"mobility|gait|balance", re.IGNORECASE)
+_CHRONIC_CONDITION_RE = re.compile(r"diabetes|heart failure|copd|kidney disease", re.IGNORECASE)
+_HIGH_RISK_CONDITION_RE = re.compile(r"sepsis|shock|respiratory failure|cardiac arrest", re.IGNORECASE)
+
+# Preventive screenings: (name, order description pattern, how recent the last
+# completed order must be, minimum age, gender or None for all, alert when due)
+_PREVENTIVE_SCREENINGS = (
+    ("colonoscopy", "%colonoscopy%", timedelta(days=3650), 50, None, {
+        "type": "preventive_care",
+        "message": "Colonoscopy screening due (age 50+)",
+        "action_required": "Schedule screening colonoscopy"
+    }),
+    ("mammogram", "%mammogram%", timedelta(days=365), 40, "female", {
+        "type": "preventive_care",
+        "message": "Annual mammogram due",
+        "action_required": "Schedule mammogram"
+    })
+)
+
 class ClinicalDecisionSupport:
     """Advanced clinical decision support system"""
     
     def __init__(self):
         self.drug_checker = DrugInteractionChecker()
         self.guideline_engine = GuidelineEngine()
+        self._get_recommendations = async_ttl_cache(GUIDELINE_CACHE_SIZE, GUIDELINE_CACHE_TTL)(
+            self.guideline_engine.get_recommendations
+        )
+        self._get_interactions = async_ttl_cache(DRUG_INTERACTION_CACHE_SIZE, DRUG_INTERACTION_CACHE_TTL)(
+            self._check_medication_set
+        )
     
-    async def get_patient_alerts(self, patient_id: str, db: Session) -> List[Dict[str, Any]]:
+    async def get_patient_alerts(self, patient_id: str, db: AsyncSession) -> List[Dict[str, Any]]:
         """Get all clinical alerts for a patient"""
-        alerts = []
-        
-        # Drug interaction alerts
-        drug_alerts = await self._check_drug_interactions(patient_id, db)
-        alerts.extend(drug_alerts)
-        
-        # Allergy alerts
-        allergy_alerts = await self._check_allergy_conflicts(patient_id, db)
-        alerts.extend(allergy_alerts)
-        
-        # Preventive care alerts
-        preventive_alerts = await self._check_preventive_care(patient_id, db)
-        alerts.extend(preventive_alerts)
-        
-        # Critical lab value alerts
-        lab_alerts = await self._check_critical_labs(patient_id, db)
-        alerts.extend(lab_alerts)
-        
-        return alerts
+        # Drug interaction, allergy, preventive care and critical lab checks
+        # are independent; each runs on its own session so they overlap. One
+        # clock reading keeps their time windows aligned.
+        now = datetime.now()
+        results = await asyncio.gather(
+            run_in_session(self._check_drug_interactions, patient_id),
+            run_in_session(self._check_allergy_conflicts, patient_id, now),
+            run_in_session(self._check_preventive_care, patient_id, now),
+            run_in_session(self._check_critical_labs, patient_id, now)
+        )
+        
+        return list(itertools.chain.from_iterable(results))
     
-    async def calculate_risk_scores(self, patient_id: str, db: Session) -> Dict[str, float]:
+    async def calculate_risk_scores(self, patient_id: str, db: AsyncSession) -> Dict[str, float]:
         """Calculate clinical risk scores"""
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        patient = await db.get(Patient, patient_id)
         if not patient:
             return {}
         
-        # Calculate age
-        age = (datetime.now() - patient.date_of_birth).days / 365.25
-        
-        # Get recent encounters and diagnoses
-        recent_encounters = db.query(Encounter).filter(
-            Encounter.patient_id == patient_id,
-            Encounter.start_time >= datetime.now() - timedelta(days=365)
-        ).all()
+        # Calculate age once; the helpers only need the number
+        age = patient.age
+        # One clock reading for the encounter window shared by both queries
+        since = datetime.now() - timedelta(days=365)
+        
+        # Get recent encounters and diagnoses in two queries (encounters, then
+        # one IN query for all their diagnoses), loading only the columns the
+        # risk helpers read; anything else they touch raises instead of
+        # lazily loading per encounter
+        recent_encounters = (await db.scalars(
+            select(Encounter)
+            .options(
+                load_only(Encounter.encounter_type, raiseload=True),
+                selectinload(Encounter.diagnoses).load_only(Diagnosis.description, raiseload=True),
+                raiseload("*")
+            )
+            .where(
+                Encounter.patient_id == patient_id,
+                Encounter.start_time >= since
+            )
+        )).all()
+        
+        # Only the sepsis helper queries; the others never await, so the
+        # session is not used concurrently
+        fall_risk, readmission_risk, mortality_risk, sepsis_risk = await asyncio.gather(
+            self._calculate_fall_risk(age, recent_encounters),
+            self._calculate_readmission_risk(age, recent_encounters),
+            self._calculate_mortality_risk(age, recent_encounters),
+            self._calculate_sepsis_risk(patient_id, since, db)
+        )
         
-        risk_scores = {
-            "fall_risk": await self._calculate_fall_risk(patient, recent_encounters),
-            "readmission_risk": await self._calculate_readmission_risk(patient, recent_encounters),
-            "mortality_risk": await self._calculate_mortality_risk(patient, recent_encounters),
-            "sepsis_risk": await self._calculate_sepsis_risk(patient, recent_encounters)
+        return {
+            "fall_risk": fall_risk,
+            "readmission_risk": readmission_risk,
+            "mortality_risk": mortality_risk,
+            "sepsis_risk": sepsis_risk
         }
-        
-        return risk_scores
     
-    async def evaluate_encounter(self, encounter_id: str, db: Session):
+    def bulk_risk_scores(self, vitals: Dict[str, np.ndarray]) -> np.ndarray:
+        """Vitals-based risk scores for many patients in one vectorised pass
+        
+        vitals holds one float32 column per vital sign across all patients,
+        NaN where a value was not recorded (NaN fails every threshold). The
+        result has one row per patient and one column per BULK_RISK_COLUMNS.
+        """
+        systolic = vitals["blood_pressure_systolic"]
+        respiratory_rate = vitals["respiratory_rate"]
+        oxygen_saturation = vitals["oxygen_saturation"]
+        
+        # qSOFA vitals criteria; altered mental status needs diagnoses and is
+        # only scored by the per-patient calculate_risk_scores
+        sepsis_risk = ((systolic <= 100).astype(np.float32) + (respiratory_rate >= 22)) / 3.0
+        critical_vitals = (systolic > 180) | (oxygen_saturation < 90)
+        
+        return np.column_stack((sepsis_risk, critical_vitals)).astype(np.float32)
+    
+    async def evaluate_encounter(self, encounter_id: str, db: AsyncSession):
         """Evaluate encounter for clinical decision support"""
-        encounter = db.query(Encounter).filter(Encounter.id == encounter_id).first()
+        encounter = await db.get(
+            Encounter, encounter_id,
+            options=[selectinload(Encounter.diagnoses), raiseload("*")],
+            populate_existing=True
+        )
         if not encounter:
             return
         
-        # Check for sepsis criteria
-        await self._evaluate_sepsis_criteria(encounter, db)
+        # Sepsis criteria, deterioration indicators and guideline
+        # recommendations run together; only the sepsis check queries the
+        # session, so sharing it is safe
+        await asyncio.gather(
+            self._evaluate_sepsis_criteria(encounter, datetime.now(), db),
+            self._evaluate_deterioration_risk(encounter, db),
+            self._get_guideline_recommendations(encounter, db)
+        )
+    
+    async def evaluate_encounters_batch(self, encounter_ids: List[str], db: AsyncSession) -> Dict[Any, Dict[str, int]]:
+        """SIRS and NEWS2 for many encounters with vectorised scoring
+        
+        Same thresholds and alerts as evaluate_encounter, but vitals are read
+        as plain columns in one query, the latest CBC per patient in a second,
+        and every encounter is scored in a single NumPy pass. Guideline
+        recommendations are not fetched. Returns the scores by encounter id.
+        """
+        rows = (await db.execute(
+            select(Encounter.id, Encounter.patient_id, *(getattr(Encounter, field) for field in BATCH_VITAL_COLUMNS))
+            .where(Encounter.id.in_(encounter_ids))
+        )).all()
+        if not rows:
+            return {}
         
-        # Check for deterioration indicators
-        await self._evaluate_deterioration_risk(encounter, db)
+        ids, patient_ids, *columns = zip(*rows)
+        # Unrecorded (None or 0) vitals become NaN, which fails every comparison
+        vitals = {
+            field: np.fromiter((float(value) if value else np.nan for value in column), dtype=np.float32, count=len(rows))
+            for field, column in zip(BATCH_VITAL_COLUMNS, columns)
+        }
+        temperature = vitals["temperature"]
+        
+        recent_cbc = dict((await db.execute(
+            select(Order.patient_id, Order.results)
+            .where(
+                Order.patient_id.in_(set(patient_ids)),
+                Order.order_type == "lab",
+                Order.description.ilike("%cbc%"),
+                Order.completed_at >= datetime.now() - timedelta(hours=24)
+            )
+            .distinct(Order.patient_id)
+            .order_by(Order.patient_id, Order.completed_at.desc())
+        )).all())
+        wbc = np.fromiter(
+            (float(value) if (value := (recent_cbc.get(patient_id) or {}).get("wbc")) else np.nan for patient_id in patient_ids),
+            dtype=np.float32,
+            count=len(rows)
+        )
+        
+        sirs_count = (
+            ((temperature > 38.0) | (temperature < 36.0)).astype(np.int8)
+            + (vitals["heart_rate"] > 90)
+            + (vitals["respiratory_rate"] > 20)
+            + ((wbc > 12000) | (wbc < 4000))
+        )
+        
+        # Same bands as the single-encounter path: the first bound a value
+        # does not exceed picks its points, and values above the last bound
+        # take the top band
+        news2_score = sum(
+            np.select([vitals[field] <= bound for bound in bounds] + [vitals[field] > bounds[-1]], points)
+            for field, bounds, points in _NEWS2_BANDS
+        )
+        
+        for i in np.flatnonzero(sirs_count >= 2):
+            logger.warning(f"SEPSIS ALERT: Patient {patient_ids[i]} meets SIRS criteria ({sirs_count[i]}/4)")
+        for i in np.flatnonzero(news2_score >= 5):
+            if news2_score[i] >= 7:
+                logger.critical(f"CRITICAL DETERIORATION: Patient {patient_ids[i]} NEWS2 score: {news2_score[i]}")
+            else:
+                logger.warning(f"DETERIORATION RISK: Patient {patient_ids[i]} NEWS2 score: {news2_score[i]}")
         
-        # Guideline recommendations
-        await self._get_guideline_recommendations(encounter, db)
+        return {
+            encounter_id: {"sirs_count": sirs, "news2_score": news2}
+            for encounter_id, sirs, news2 in zip(ids, sirs_count.tolist(), news2_score.tolist())
+        }
     
-    async def _check_drug_interactions(self, patient_id: str, db: Session) -> List[Dict[str, Any]]:
+    async def _check_drug_interactions(self, patient_id: str, db: AsyncSession) -> List[Dict[str, Any]]:
         """Check for drug-drug interactions"""
         # Get active medication orders
-        active_meds = db.query(Order).filter(
-            Order.patient_id == patient_id,
-            Order.order_type == "medication",
-            Order.status.in_(["ordered", "in_progress"])
-        ).all()
-        
-        if len(active_meds) < 2:
+        active_meds = (await db.scalars(
+            select(Order.description).where(
+                Order.patient_id == patient_id,
+                Order.order_type == "medication",
+                Order.status.in_(["ordered", "in_progress"])
+            )
+        )).all()
+        
+        # Order and case do not change which interactions apply, so the same
+        # regimen maps to one cache entry however it was entered
+        medications = frozenset(description.strip().lower() for description in active_meds)
+        if len(medications) < 2:
             return []
         
-        interactions = await self.drug_checker.check_interactions([
-            med.description for med in active_meds
-        ])
+        interactions = await self._get_interactions(medications)
         
         alerts = []
         for interaction in interactions:
@@ -111,90 +281,81 @@ class ClinicalDecisionSupport:
         
         return alerts
     
-    async def _check_allergy_conflicts(self, patient_id: str, db: Session) -> List[Dict[str, Any]]:
+    async def _check_medication_set(self, medications: frozenset) -> List[Dict[str, Any]]:
+        """Interactions within a medication set, from the external checker"""
+        return await self.drug_checker.check_interactions(sorted(medications))
+    
+    async def _check_allergy_conflicts(self, patient_id: str, now: datetime, db: AsyncSession) -> List[Dict[str, Any]]:
         """Check for allergy conflicts with orders"""
         from src.models.clinical import PatientAllergy
         
-        # Get patient allergies
-        allergies = db.query(PatientAllergy).filter(
-            PatientAllergy.patient_id == patient_id,
-            PatientAllergy.is_active == True
-        ).all()
-        
-        if not allergies:
-            return []
-        
-        # Get recent orders
-        recent_orders = db.query(Order).filter(
-            Order.patient_id == patient_id,
-            Order.ordered_at >= datetime.now() - timedelta(hours=24)
-        ).all()
-        
-        alerts = []
-        for order in recent_orders:
-            for allergy in allergies:
-                if allergy.allergen.lower() in order.description.lower():
-                    alerts.append({
-                        "type": "allergy_conflict",
-                        "severity": allergy.severity,
-                        "message": f"Allergy conflict: {allergy.allergen}",
-                        "order": order.description,
-                        "action_required": "Review order against allergy"
-                    })
-        
-        return alerts
+        # Match active allergies against the last 24h of orders in one query;
+        # only conflicting pairs come back
+        conflicts = await db.execute(
+            select(PatientAllergy.allergen, PatientAllergy.severity, Order.description)
+            .join(Order, Order.patient_id == PatientAllergy.patient_id)
+            .where(
+                PatientAllergy.patient_id == patient_id,
+                PatientAllergy.is_active == True,
+                Order.ordered_at >= now - timedelta(hours=24),
+                # Plain substring test, so % or _ in an allergen are literal
+                func.strpos(func.lower(Order.description), func.lower(PatientAllergy.allergen)) > 0
+            )
+            .order_by(Order.ordered_at, Order.id, PatientAllergy.id)
+        )
+        
+        return [
+            {
+                "type": "allergy_conflict",
+                "severity": severity,
+                "message": f"Allergy conflict: {allergen}",
+                "order": description,
+                "action_required": "Review order against allergy"
+            }
+            for allergen, severity, description in conflicts
+        ]
     
-    async def _check_preventive_care(self, patient_id: str, db: Session) -> List[Dict[str, Any]]:
+    async def _check_preventive_care(self, patient_id: str, now: datetime, db: AsyncSession) -> List[Dict[str, Any]]:
         """Check for due preventive care measures"""
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        patient = await db.get(Patient, patient_id)
         if not patient:
             return []
         
-        age = (datetime.now() - patient.date_of_birth).days / 365.25
-        alerts = []
-        
-        # Age-based screening recommendations
-        if age >= 50:
-            # Check for recent colonoscopy
-            recent_colonoscopy = db.query(Order).filter(
-                Order.patient_id == patient_id,
-                Order.description.ilike("%colonoscopy%"),
-                Order.completed_at >= datetime.now() - timedelta(days=3650)  # 10 years
-            ).first()
-            
-            if not recent_colonoscopy:
-                alerts.append({
-                    "type": "preventive_care",
-                    "message": "Colonoscopy screening due (age 50+)",
-                    "action_required": "Schedule screening colonoscopy"
-                })
-        
-        if age >= 40 and patient.gender.lower() == "female":
-            # Check for recent mammogram
-            recent_mammogram = db.query(Order).filter(
-                Order.patient_id == patient_id,
-                Order.description.ilike("%mammogram%"),
-                Order.completed_at >= datetime.now() - timedelta(days=365)
-            ).first()
-            
-            if not recent_mammogram:
-                alerts.append({
-                    "type": "preventive_care",
-                    "message": "Annual mammogram due",
-                    "action_required": "Schedule mammogram"
-                })
+        age = patient.age
+        gender = (patient.gender or "").lower()
+        eligible = [
+            screening for screening in _PREVENTIVE_SCREENINGS
+            if age >= screening[3] and screening[4] in (None, gender)
+        ]
+        if not eligible:
+            return []
         
-        return alerts
+        # Most recent completed order per eligible screening, in one query
+        category = case(*(
+            (Order.description.ilike(pattern), name) for name, pattern, *_ in eligible
+        ))
+        last_completed = dict((await db.execute(
+            select(category, func.max(Order.completed_at))
+            .where(Order.patient_id == patient_id, category.is_not(None))
+            .group_by(category)
+        )).all())
+        
+        return [
+            alert for name, _, interval, _, _, alert in eligible
+            if not (last_completed.get(name) and last_completed[name] >= now - interval)
+        ]
     
-    async def _check_critical_labs(self, patient_id: str, db: Session) -> List[Dict[str, Any]]:
+    async def _check_critical_labs(self, patient_id: str, now: datetime, db: AsyncSession) -> List[Dict[str, Any]]:
         """Check for critical laboratory values"""
         # Get recent lab orders with results
-        recent_labs = db.query(Order).filter(
-            Order.patient_id == patient_id,
-            Order.order_type == "lab",
-            Order.result_status == "critical",
-            Order.completed_at >= datetime.now() - timedelta(hours=24)
-        ).all()
+        recent_labs = (await db.execute(
+            select(Order.description, Order.results).where(
+                Order.patient_id == patient_id,
+                Order.order_type == "lab",
+                Order.result_status == "critical",
+                Order.completed_at >= now - timedelta(hours=24)
+            ).order_by(Order.completed_at.desc())
+        )).all()
         
         alerts = []
         for lab in recent_labs:
@@ -207,10 +368,9 @@ class ClinicalDecisionSupport:
         
         return alerts
     
-    async def _calculate_fall_risk(self, patient: Patient, encounters: List[Encounter]) -> float:
+    async def _calculate_fall_risk(self, age: float, encounters: List[Encounter]) -> float:
         """Calculate fall risk score using Morse Fall Scale"""
         score = 0
-        age = (datetime.now() - patient.date_of_birth).days / 365.25
         
         # Age factor
         if age >= 65:
@@ -221,20 +381,20 @@ class ClinicalDecisionSupport:
         # History of falls (check diagnoses)
         for encounter in encounters:
             for diagnosis in encounter.diagnoses:
-                if "fall" in diagnosis.description.lower():
+                if _FALL_RE.search(diagnosis.description):
                     score += 25
                     break
         
         # Mobility issues
         for encounter in encounters:
             for diagnosis in encounter.diagnoses:
-                if any(term in diagnosis.description.lower() for term in ["mobility", "gait", "balance"]):
+                if _MOBILITY_RE.search(diagnosis.description):
                     score += 20
                     break
         
         return min(score / 100.0, 1.0)  # Normalize to 0-1
     
-    async def _calculate_readmission_risk(self, patient: Patient, encounters: List[Encounter]) -> float:
+    async def _calculate_readmission_risk(self, age: float, encounters: List[Encounter]) -> float:
         """Calculate 30-day readmission risk"""
         if not encounters:
             return 0.0
@@ -247,65 +407,74 @@ class ClinicalDecisionSupport:
             score += 30
         
         # Comorbidities
-        chronic_conditions = ["diabetes", "heart failure", "copd", "kidney disease"]
         for encounter in encounters:
             for diagnosis in encounter.diagnoses:
-                if any(condition in diagnosis.description.lower() for condition in chronic_conditions):
+                if _CHRONIC_CONDITION_RE.search(diagnosis.description):
                     score += 10
         
         # Age factor
-        age = (datetime.now() - patient.date_of_birth).days / 365.25
         if age >= 65:
             score += 15
         
         return min(score / 100.0, 1.0)
     
-    async def _calculate_mortality_risk(self, patient: Patient, encounters: List[Encounter]) -> float:
+    async def _calculate_mortality_risk(self, age: float, encounters: List[Encounter]) -> float:
         """Calculate mortality risk using clinical indicators"""
         # This would integrate with validated scoring systems like APACHE II, SAPS II
         # For demonstration, using simplified logic
         score = 0
         
-        age = (datetime.now() - patient.date_of_birth).days / 365.25
         if age >= 80:
             score += 40
         elif age >= 65:
             score += 20
         
         # Check for high-risk diagnoses
-        high_risk_conditions = ["sepsis", "shock", "respiratory failure", "cardiac arrest"]
         for encounter in encounters:
             for diagnosis in encounter.diagnoses:
-                if any(condition in diagnosis.description.lower() for condition in high_risk_conditions):
+                if _HIGH_RISK_CONDITION_RE.search(diagnosis.description):
                     score += 30
         
         return min(score / 100.0, 1.0)
     
-    async def _calculate_sepsis_risk(self, patient: Patient, encounters: List[Encounter]) -> float:
+    async def _calculate_sepsis_risk(self, patient_id: str, since: datetime, db: AsyncSession) -> float:
         """Calculate sepsis risk using qSOFA criteria"""
-        if not encounters:
+        # Vitals of the most recent encounter, with altered mental status
+        # (would need additional assessment; for now, a relevant diagnosis)
+        # flagged in the same row
+        latest_encounter = (await db.execute(
+            select(
+                Encounter.blood_pressure_systolic,
+                Encounter.respiratory_rate,
+                exists().where(
+                    Diagnosis.encounter_id == Encounter.id,
+                    Diagnosis.description.ilike("%altered mental status%")
+                )
+            )
+            .where(Encounter.patient_id == patient_id, Encounter.start_time >= since)
+            .order_by(Encounter.start_time.desc())
+            .limit(1)
+        )).first()
+        
+        if latest_encounter is None:
             return 0.0
         
-        latest_encounter = encounters[0]
-        score = 0
+        systolic, respiratory_rate, altered_mental_status = latest_encounter
         
         # qSOFA criteria
-        if latest_encounter.blood_pressure_systolic and latest_encounter.blood_pressure_systolic <= 100:
+        score = 0
+        if systolic and systolic <= 100:
             score += 1
         
-        if latest_encounter.respiratory_rate and latest_encounter.respiratory_rate >= 22:
+        if respiratory_rate and respiratory_rate >= 22:
             score += 1
         
-        # Altered mental status (would need additional assessment)
-        # For now, check for relevant diagnoses
-        for diagnosis in latest_encounter.diagnoses:
-            if "altered mental status" in diagnosis.description.lower():
-                score += 1
-                break
+        if altered_mental_status:
+            score += 1
         
         return score / 3.0  # qSOFA is 0-3, normalize to 0-1
     
-    async def _evaluate_sepsis_criteria(self, encounter: Encounter, db: Session):
+    async def _evaluate_sepsis_criteria(self, encounter: Encounter, now: datetime, db: AsyncSession):
         """Evaluate for sepsis using SIRS criteria"""
         sirs_count = 0
         
@@ -324,15 +493,18 @@ class ClinicalDecisionSupport:
         
         # WBC (would need lab integration)
         # For now, check recent lab orders
-        recent_cbc = db.query(Order).filter(
-            Order.patient_id == encounter.patient_id,
-            Order.order_type == "lab",
-            Order.description.ilike("%cbc%"),
-            Order.completed_at >= datetime.now() - timedelta(hours=24)
-        ).first()
-        
-        if recent_cbc and recent_cbc.results:
-            wbc = recent_cbc.results.get("wbc")
+        # Only the results payload is needed, not a hydrated Order
+        cbc_results = await db.scalar(
+            select(Order.results).where(
+                Order.patient_id == encounter.patient_id,
+                Order.order_type == "lab",
+                Order.description.ilike("%cbc%"),
+                Order.completed_at >= now - timedelta(hours=24)
+            ).limit(1)
+        )
+        
+        if cbc_results:
+            wbc = cbc_results.get("wbc")
             if wbc and (wbc > 12000 or wbc < 4000):
                 sirs_count += 1
         
@@ -341,62 +513,13 @@ class ClinicalDecisionSupport:
             # Create alert in system
             logger.warning(f"SEPSIS ALERT: Patient {encounter.patient_id} meets SIRS criteria ({sirs_count}/4)")
     
-    async def _evaluate_deterioration_risk(self, encounter: Encounter, db: Session):
+    async def _evaluate_deterioration_risk(self, encounter: Encounter, db: AsyncSession):
         """Evaluate for clinical deterioration using NEWS2 score"""
         news2_score = 0
-        
-        # Respiratory rate scoring
-        if encounter.respiratory_rate:
-            if encounter.respiratory_rate <= 8:
-                news2_score += 3
-            elif encounter.respiratory_rate <= 11:
-                news2_score += 1
-            elif encounter.respiratory_rate >= 25:
-                news2_score += 3
-            elif encounter.respiratory_rate >= 21:
-                news2_score += 2
-        
-        # Oxygen saturation scoring
-        if encounter.oxygen_saturation:
-            if encounter.oxygen_saturation <= 91:
-                news2_score += 3
-            elif encounter.oxygen_saturation <= 93:
-                news2_score += 2
-            elif encounter.oxygen_saturation <= 95:
-                news2_score += 1
-        
-        # Blood pressure scoring
-        if encounter.blood_pressure_systolic:
-            if encounter.blood_pressure_systolic <= 90:
-                news2_score += 3
-            elif encounter.blood_pressure_systolic <= 100:
-                news2_score += 2
-            elif encounter.blood_pressure_systolic <= 110:
-                news2_score += 1
-            elif encounter.blood_pressure_systolic >= 220:
-                news2_score += 3
-        
-        # Heart rate scoring
-        if encounter.heart_rate:
-            if encounter.heart_rate <= 40:
-                news2_score += 3
-            elif encounter.heart_rate <= 50:
-                news2_score += 1
-            elif encounter.heart_rate >= 131:
-                news2_score += 3
-            elif encounter.heart_rate >= 111:
-                news2_score += 2
-            elif encounter.heart_rate >= 91:
-                news2_score += 1
-        
-        # Temperature scoring
-        if encounter.temperature:
-            if encounter.temperature <= 35.0:
-                news2_score += 3
-            elif encounter.temperature >= 39.1:
-                news2_score += 2
-            elif encounter.temperature >= 38.1:
-                news2_score += 1
+        for field, thresholds, points in _NEWS2_BANDS:
+            value = getattr(encounter, field)
+            if value:
+                news2_score += points[bisect_left(thresholds, value)]
         
         # Generate alerts based on NEWS2 score
         if news2_score >= 7:
@@ -404,33 +527,36 @@ class ClinicalDecisionSupport:
         elif news2_score >= 5:
             logger.warning(f"DETERIORATION RISK: Patient {encounter.patient_id} NEWS2 score: {news2_score}")
     
-    async def _get_guideline_recommendations(self, encounter: Encounter, db: Session):
+    async def _get_guideline_recommendations(self, encounter: Encounter, db: AsyncSession):
         """Get evidence-based guideline recommendations"""
-        recommendations = []
+        # Get patient diagnoses; a condition coded on several diagnoses
+        # (common for re-coded chronic conditions) is looked up once
+        diagnoses = dict.fromkeys(d.icd10_code for d in encounter.diagnoses if d.icd10_code)
         
-        # Get patient diagnoses
-        diagnoses = [d.icd10_code for d in encounter.diagnoses]
+        # Get recommendations from guideline engine, concurrently and cached
+        # per code across patients
+        results = await asyncio.gather(*(
+            self._get_recommendations(diagnosis) for diagnosis in diagnoses
+        ))
         
-        # Get recommendations from guideline engine
-        for diagnosis in diagnoses:
-            guideline_recs = await self.guideline_engine.get_recommendations(diagnosis)
-            recommendations.extend(guideline_recs)
-        
-        return recommendations
+        return [recommendation for guideline_recs in results for recommendation in guideline_recs]
+
+def _whole_days(start, end):
+    """SQL for the whole days between two timestamps, like timedelta.days"""
+    return func.floor(func.extract("epoch", end - start) / 86400)
 
 class QualityMetrics:
     """Quality metrics and performance indicators"""
     
-    async def get_safety_metrics(self, date_from: datetime, date_to: datetime, db: Session) -> Dict[str, Any]:
+    async def get_safety_metrics(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> Dict[str, Any]:
         """Patient safety metrics"""
-        # Hospital-acquired infections
-        hai_rate = await self._calculate_hai_rate(date_from, date_to, db)
-        
-        # Medication errors
-        med_error_rate = await self._calculate_medication_error_rate(date_from, date_to, db)
-        
-        # Fall rates
-        fall_rate = await self._calculate_fall_rate(date_from, date_to, db)
+        # Hospital-acquired infections, medication errors and falls are
+        # independent aggregates; each runs on its own pooled connection
+        hai_rate, med_error_rate, fall_rate = await asyncio.gather(
+            run_in_session(self._calculate_hai_rate, date_from, date_to),
+            run_in_session(self._calculate_medication_error_rate, date_from, date_to),
+            run_in_session(self._calculate_fall_rate, date_from, date_to)
+        )
         
         return {
             "hospital_acquired_infection_rate": hai_rate,
@@ -440,16 +566,14 @@ class QualityMetrics:
             "central_line_infection_rate": 0.0  # Would implement with device tracking
         }
     
-    async def get_outcome_metrics(self, date_from: datetime, date_to: datetime, db: Session) -> Dict[str, Any]:
+    async def get_outcome_metrics(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> Dict[str, Any]:
         """Clinical outcome metrics"""
-        # Mortality rates
-        mortality_rate = await self._calculate_mortality_rate(date_from, date_to, db)
-        
-        # Readmission rates
-        readmission_rate = await self._calculate_readmission_rate(date_from, date_to, db)
-        
-        # Length of stay
-        avg_los = await self._calculate_average_los(date_from, date_to, db)
+        # Mortality, readmission and length of stay run concurrently
+        mortality_rate, readmission_rate, avg_los = await asyncio.gather(
+            run_in_session(self._calculate_mortality_rate, date_from, date_to),
+            run_in_session(self._calculate_readmission_rate, date_from, date_to),
+            run_in_session(self._calculate_average_los, date_from, date_to)
+        )
         
         return {
             "mortality_rate": mortality_rate,
@@ -459,86 +583,87 @@ class QualityMetrics:
             "surgical_site_infection_rate": 0.0  # Would implement with surgical data
         }
     
-    async def _calculate_hai_rate(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_hai_rate(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate hospital-acquired infection rate"""
         # This would integrate with infection control data
-        # For demonstration, using diagnosis codes
-        hai_diagnoses = db.query(Diagnosis).join(Encounter).filter(
-            Encounter.start_time.between(date_from, date_to),
-            Diagnosis.icd10_code.like("T80%")  # Healthcare-associated infection codes
-        ).count()
-        
-        total_encounters = db.query(Encounter).filter(
-            Encounter.start_time.between(date_from, date_to),
-            Encounter.encounter_type == "inpatient"
-        ).count()
+        # For demonstration, using diagnosis codes. Numerator and denominator
+        # share the date range, so one pass with conditional aggregates
+        hai_diagnoses, total_encounters = (await db.execute(
+            select(
+                # Healthcare-associated infection codes
+                func.count(Diagnosis.id).filter(Diagnosis.icd10_code.like("T80%")),
+                func.count(func.distinct(Encounter.id)).filter(Encounter.encounter_type == "inpatient")
+            )
+            .select_from(Encounter)
+            .outerjoin(Diagnosis)
+            .where(Encounter.start_time.between(date_from, date_to))
+        )).one()
         
         return (hai_diagnoses / total_encounters * 100) if total_encounters > 0 else 0.0
     
-    async def _calculate_medication_error_rate(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_medication_error_rate(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate medication error rate"""
         # This would integrate with medication administration records
         # For demonstration, using order modifications as proxy
-        total_med_orders = db.query(Order).filter(
-            Order.ordered_at.between(date_from, date_to),
-            Order.order_type == "medication"
-        ).count()
+        total_med_orders = await db.scalar(
+            select(func.count(Order.id)).where(
+                Order.ordered_at.between(date_from, date_to),
+                Order.order_type == "medication"
+            )
+        )
         
         # Simplified calculation - would need proper error reporting system
         return 0.5  # 0.5% error rate (Johns Hopkins target < 1%)
     
-    async def _calculate_fall_rate(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_fall_rate(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate patient fall rate per 1000 patient days"""
-        falls = db.query(Diagnosis).join(Encounter).filter(
-            Encounter.start_time.between(date_from, date_to),
-            Diagnosis.description.ilike("%fall%")
-        ).count()
-        
-        # Calculate patient days (simplified)
-        inpatient_encounters = db.query(Encounter).filter(
-            Encounter.start_time.between(date_from, date_to),
-            Encounter.encounter_type == "inpatient"
-        ).all()
-        
-        patient_days = sum([
-            (e.end_time - e.start_time).days if e.end_time else 1
-            for e in inpatient_encounters
-        ])
-        
-        return (falls / patient_days * 1000) if patient_days > 0 else 0.0
+        falls = await db.scalar(
+            select(func.count(Diagnosis.id)).join(Encounter).where(
+                Encounter.start_time.between(date_from, date_to),
+                Diagnosis.description.ilike("%fall%")
+            )
+        )
+        
+        # Calculate patient days (simplified); open encounters count as one day
+        patient_days = await db.scalar(
+            select(func.coalesce(func.sum(
+                case((Encounter.end_time.is_not(None), _whole_days(Encounter.start_time, Encounter.end_time)), else_=1)
+            ), 0)).where(
+                Encounter.start_time.between(date_from, date_to),
+                Encounter.encounter_type == "inpatient"
+            )
+        )
+        
+        return (falls / float(patient_days) * 1000) if patient_days > 0 else 0.0
     
-    async def _calculate_mortality_rate(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_mortality_rate(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate mortality rate"""
         # This would integrate with vital status tracking
         # For demonstration, using discharge disposition
-        total_discharges = db.query(Encounter).filter(
-            Encounter.end_time.between(date_from, date_to),
-            Encounter.encounter_type == "inpatient"
-        ).count()
+        total_discharges = await db.scalar(
+            select(func.count(Encounter.id)).where(
+                Encounter.end_time.between(date_from, date_to),
+                Encounter.encounter_type == "inpatient"
+            )
+        )
         
         # Would need proper mortality tracking
         return 2.1  # 2.1% (Johns Hopkins benchmark)
     
-    async def _calculate_readmission_rate(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_readmission_rate(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate 30-day readmission rate"""
         # Complex calculation requiring patient tracking across encounters
         # Simplified for demonstration
         return 8.5  # 8.5% (Johns Hopkins target < 10%)
     
-    async def _calculate_average_los(self, date_from: datetime, date_to: datetime, db: Session) -> float:
+    async def _calculate_average_los(self, date_from: datetime, date_to: datetime, db: AsyncSession) -> float:
         """Calculate average length of stay"""
-        completed_encounters = db.query(Encounter).filter(
-            Encounter.end_time.between(date_from, date_to),
-            Encounter.encounter_type == "inpatient",
-            Encounter.end_time.isnot(None)
-        ).all()
-        
-        if not completed_encounters:
-            return 0.0
-        
-        total_days = sum([
-            (e.end_time - e.start_time).days
-            for e in completed_encounters
-        ])
-        
-        return total_days / len(completed_encounters)
\ No newline at end of file
+        average_days = await db.scalar(
+            select(func.avg(_whole_days(Encounter.start_time, Encounter.end_time))).where(
+                Encounter.end_time.between(date_from, date_to),
+                Encounter.encounter_type == "inpatient",
+                Encounter.end_time.isnot(None)
+            )
+        )
+        
+        return float(average_days) if average_days is not None else 0.0
\ No newline at end of file
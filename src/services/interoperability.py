@@ -2,19 +2,166 @@
 Healthcare Interoperability Services
 HL7 FHIR R4 Implementation for Johns Hopkins Standards
 """
-from typing import Dict, List, Any, Optional
-import json
+from typing import AsyncIterator, Dict, List, Any, Optional, Set
 import asyncio
+import uuid
 import aiohttp
+import orjson
 from datetime import datetime
 import logging
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, raiseload
+
 from src.models.clinical import Patient, Encounter, Diagnosis, Order
 from src.config.settings import get_settings
+from src.utils.async_cache import async_ttl_cache
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Outbound FHIR connection pool: concurrent sockets, DNS cache seconds and
+# how long idle keep-alive connections are held
+FHIR_MAX_CONNECTIONS = 100
+FHIR_DNS_CACHE_TTL = 300
+FHIR_KEEPALIVE_TIMEOUT = 60
+
+# HIE lookups per (endpoint, MRN) reused for a minute, so repeated views of
+# the same patient do not go back out to every exchange
+HIE_CACHE_SIZE = 1024
+HIE_CACHE_TTL = 60
+
+# Encounters fetched per server-side cursor round-trip when streaming NDJSON
+FHIR_EXPORT_CHUNK_SIZE = 1000
+
+# LOINC code and display per vital sign
+_VITAL_CODES = {
+    "temperature": {"code": "8310-5", "display": "Body temperature"},
+    "heart_rate": {"code": "8867-4", "display": "Heart rate"},
+    "blood_pressure_systolic": {"code": "8480-6", "display": "Systolic blood pressure"},
+    "blood_pressure_diastolic": {"code": "8462-4", "display": "Diastolic blood pressure"},
+    "respiratory_rate": {"code": "9279-1", "display": "Respiratory rate"},
+    "oxygen_saturation": {"code": "2708-6", "display": "Oxygen saturation"}
+}
+
+# Constant parts of generated resources, shared by every resource that
+# embeds them. Resources are serialized as built and must be treated as
+# read-only; deep-copy one before mutating it.
+_MR_IDENTIFIER_TYPE = {
+    "coding": [
+        {
+            "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
+            "code": "MR",
+            "display": "Medical Record Number"
+        }
+    ]
+}
+
+_VITAL_SIGNS_CATEGORY = [
+    {
+        "coding": [
+            {
+                "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                "code": "vital-signs",
+                "display": "Vital Signs"
+            }
+        ]
+    }
+]
+
+_VITAL_CODINGS = {
+    vital_type: {"coding": [{"system": "http://loinc.org", **code_info}]}
+    for vital_type, code_info in _VITAL_CODES.items()
+}
+
+# UCUM unit per vital sign
+_VITAL_UNITS = {
+    "temperature": "Cel",
+    "heart_rate": "/min",
+    "blood_pressure_systolic": "mm[Hg]",
+    "blood_pressure_diastolic": "mm[Hg]",
+    "respiratory_rate": "/min",
+    "oxygen_saturation": "%"
+}
+
+# Internal encounter type to FHIR v3 ActCode encounter class
+_ENCOUNTER_CLASSES = {
+    "outpatient": "AMB",
+    "inpatient": "IMP",
+    "emergency": "EMER",
+    "virtual": "VR"
+}
+
+# Internal encounter status to FHIR R4 encounter-status code; a transient
+# encounter with no status yet gets the column default, "active"
+_ENCOUNTER_STATUSES = {
+    "active": "in-progress",
+    "completed": "finished",
+    "cancelled": "cancelled"
+}
+
+# FHIR R4 cardinality and required value-set bindings for the resources this
+# service sends, checked locally so a malformed resource is rejected before
+# a round-trip to the server rather than by a 4xx after it
+_REQUIRED_ELEMENTS = {
+    "Patient": (),
+    "Encounter": ("status", "class"),
+    "Observation": ("status", "code")
+}
+
+_CODED_ELEMENTS = {
+    "Patient": {
+        "gender": frozenset({"male", "female", "other", "unknown"})
+    },
+    "Encounter": {
+        "status": frozenset({
+            "planned", "arrived", "triaged", "in-progress", "onleave",
+            "finished", "cancelled", "entered-in-error", "unknown"
+        })
+    },
+    "Observation": {
+        "status": frozenset({
+            "registered", "preliminary", "final", "amended", "corrected",
+            "cancelled", "entered-in-error", "unknown"
+        })
+    }
+}
+
+def _reference_key(resource: Dict[str, Any]) -> Optional[str]:
+    """The "Type/id" other resources use to reference this one, if it has an id"""
+    if not resource.get("id"):
+        return None
+    return f"{resource['resourceType']}/{resource['id']}"
+
+def _collect_references(value: Any, found: Set[str]) -> Set[str]:
+    """Add every reference string in a resource to found"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "reference" and isinstance(item, str):
+                found.add(item)
+            else:
+                _collect_references(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_references(item, found)
+    return found
+
+def _rewrite_references(value: Any, targets: Dict[str, str]) -> Any:
+    """Copy of a resource with references found in targets replaced
+    
+    Resources share constant parts, so this rebuilds rather than mutates.
+    """
+    if isinstance(value, dict):
+        return {
+            key: targets.get(item, item) if key == "reference" and isinstance(item, str)
+            else _rewrite_references(item, targets)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_rewrite_references(item, targets) for item in value]
+    return value
+
 class FHIRService:
     """HL7 FHIR R4 implementation for interoperability"""
     
@@ -24,8 +171,34 @@ class FHIRService:
             "Content-Type": "application/fhir+json",
             "Accept": "application/fhir+json"
         }
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session, created on first use
+        
+        Connections to the FHIR server are pooled and kept alive across
+        resources instead of paying a TCP and TLS handshake per POST. Bodies
+        are posted as orjson bytes; the session's Content-Type header keeps
+        them labelled application/fhir+json.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(
+                    limit=FHIR_MAX_CONNECTIONS,
+                    ttl_dns_cache=FHIR_DNS_CACHE_TTL,
+                    keepalive_timeout=FHIR_KEEPALIVE_TIMEOUT
+                )
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the pooled HTTP session; call on application shutdown"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
-    async def create_patient_resource(self, patient: Patient) -> Dict[str, Any]:
+    def create_patient_resource(self, patient: Patient) -> Dict[str, Any]:
         """Convert patient to FHIR Patient resource"""
         fhir_patient = {
             "resourceType": "Patient",
@@ -33,15 +206,7 @@ class FHIRService:
             "identifier": [
                 {
                     "use": "usual",
-                    "type": {
-                        "coding": [
-                            {
-                                "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
-                                "code": "MR",
-                                "display": "Medical Record Number"
-                            }
-                        ]
-                    },
+                    "type": _MR_IDENTIFIER_TYPE,
                     "value": patient.mrn
                 }
             ],
@@ -85,12 +250,12 @@ class FHIRService:
         
         return fhir_patient
     
-    async def create_encounter_resource(self, encounter: Encounter) -> Dict[str, Any]:
+    def create_encounter_resource(self, encounter: Encounter) -> Dict[str, Any]:
         """Convert encounter to FHIR Encounter resource"""
         fhir_encounter = {
             "resourceType": "Encounter",
             "id": str(encounter.id),
-            "status": encounter.status,
+            "status": self._map_encounter_status(encounter.status),
             "class": {
                 "system": "http://terminology.hl7.org/CodeSystem/v3-ActCode",
                 "code": self._map_encounter_class(encounter.encounter_type),
@@ -126,45 +291,17 @@ class FHIRService:
         
         return fhir_encounter
     
-    async def create_observation_resource(self, encounter: Encounter, vital_type: str, value: float) -> Dict[str, Any]:
+    def create_observation_resource(self, encounter: Encounter, vital_type: str, value: float) -> Dict[str, Any]:
         """Create FHIR Observation for vital signs"""
-        vital_codes = {
-            "temperature": {"code": "8310-5", "display": "Body temperature"},
-            "heart_rate": {"code": "8867-4", "display": "Heart rate"},
-            "blood_pressure_systolic": {"code": "8480-6", "display": "Systolic blood pressure"},
-            "blood_pressure_diastolic": {"code": "8462-4", "display": "Diastolic blood pressure"},
-            "respiratory_rate": {"code": "9279-1", "display": "Respiratory rate"},
-            "oxygen_saturation": {"code": "2708-6", "display": "Oxygen saturation"}
-        }
-        
-        if vital_type not in vital_codes:
+        code = _VITAL_CODINGS.get(vital_type)
+        if code is None:
             raise ValueError(f"Unknown vital sign type: {vital_type}")
         
-        code_info = vital_codes[vital_type]
-        
         observation = {
             "resourceType": "Observation",
             "status": "final",
-            "category": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/observation-category",
-                            "code": "vital-signs",
-                            "display": "Vital Signs"
-                        }
-                    ]
-                }
-            ],
-            "code": {
-                "coding": [
-                    {
-                        "system": "http://loinc.org",
-                        "code": code_info["code"],
-                        "display": code_info["display"]
-                    }
-                ]
-            },
+            "category": _VITAL_SIGNS_CATEGORY,
+            "code": code,
             "subject": {
                 "reference": f"Patient/{encounter.patient_id}"
             },
@@ -186,46 +323,183 @@ class FHIRService:
             logger.warning("FHIR server URL not configured")
             return None
         
+        errors = self.validate_resource(resource)
+        if errors:
+            logger.error(f"Not sending invalid FHIR resource: {'; '.join(errors)}")
+            return None
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/{resource['resourceType']}"
-                async with session.post(url, json=resource, headers=self.headers) as response:
-                    if response.status == 201:
-                        return await response.json()
-                    else:
-                        logger.error(f"FHIR server error: {response.status}")
-                        return None
+            url = f"{self.base_url}/{resource['resourceType']}"
+            async with self._get_session().post(url, data=orjson.dumps(resource)) as response:
+                if response.status == 201:
+                    return await response.json(loads=orjson.loads, content_type=None)
+                else:
+                    logger.error(f"FHIR server error: {response.status}")
+                    return None
         except Exception as e:
             logger.error(f"Error sending to FHIR server: {str(e)}")
             return None
     
+    async def send_bundle(self, bundle: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Send every resource of a bundle to the FHIR server in one transaction
+        
+        The entries are POSTed as a single transaction Bundle, which the server
+        applies atomically in one round-trip. Each entry gets a urn:uuid
+        fullUrl and references between entries point at those, so the server
+        links them to the resources it creates in the same transaction.
+        Servers that reject transactions as not supported get the resources
+        one by one instead. The bundle passed in is not modified.
+        """
+        if not self.base_url:
+            logger.warning("FHIR server URL not configured")
+            return None
+        
+        errors = [
+            error for entry in bundle["entry"]
+            for error in self.validate_resource(entry["resource"])
+        ]
+        if errors:
+            logger.error(f"Not sending FHIR bundle with invalid resources: {'; '.join(errors)}")
+            return None
+        
+        full_urls = {}
+        for entry in bundle["entry"]:
+            key = _reference_key(entry["resource"])
+            if key:
+                full_urls[key] = f"urn:uuid:{entry['resource']['id']}"
+        
+        transaction = {
+            **bundle,
+            "type": "transaction",
+            "entry": [
+                {
+                    **entry,
+                    "fullUrl": full_urls.get(_reference_key(entry["resource"])) or f"urn:uuid:{uuid.uuid4()}",
+                    "resource": _rewrite_references(entry["resource"], full_urls),
+                    "request": {"method": "POST", "url": entry["resource"]["resourceType"]}
+                }
+                for entry in bundle["entry"]
+            ]
+        }
+        
+        try:
+            async with self._get_session().post(self.base_url, data=orjson.dumps(transaction)) as response:
+                if response.status == 200:
+                    return await response.json(loads=orjson.loads, content_type=None)
+                if not await self._transaction_unsupported(response):
+                    logger.error(f"FHIR server error: {response.status}")
+                    return None
+        except Exception as e:
+            logger.error(f"Error sending bundle to FHIR server: {str(e)}")
+            return None
+        
+        logger.info("FHIR server does not support transactions, sending resources individually")
+        created = await self._send_resources_individually([entry["resource"] for entry in bundle["entry"]])
+        return {
+            "resourceType": "Bundle",
+            "type": "batch-response",
+            "entry": [{"resource": resource} for resource in created]
+        }
+    
+    async def _send_resources_individually(self, resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """POST resources one at a time, each after the resources it references
+        
+        Resources with no unsent dependencies go out concurrently, and
+        references to resources already created are rewritten to the ids the
+        server assigned them. Resources referencing one that failed are not
+        sent, as their reference could not resolve.
+        """
+        server_references: Dict[str, str] = {}
+        failed: Set[str] = set()
+        created = []
+        pending = [
+            (_reference_key(resource), _collect_references(resource, set()), resource)
+            for resource in resources
+        ]
+        
+        while pending:
+            unsent = {key for key, _, _ in pending if key}
+            ready = [item for item in pending if not item[1] & unsent]
+            # A reference cycle cannot be ordered; send what is left as is
+            ready = ready or pending
+            ready_ids = {id(item) for item in ready}
+            pending = [item for item in pending if id(item) not in ready_ids]
+            
+            sendable = []
+            for key, references, resource in ready:
+                if references & failed:
+                    logger.error(f"Not sending {key or resource['resourceType']}: a resource it references failed")
+                    if key:
+                        failed.add(key)
+                else:
+                    sendable.append((key, resource))
+            
+            results = await asyncio.gather(*(
+                self.send_to_fhir_server(_rewrite_references(resource, server_references))
+                for _, resource in sendable
+            ))
+            for (key, resource), result in zip(sendable, results):
+                if not result:
+                    if key:
+                        failed.add(key)
+                    continue
+                created.append(result)
+                if key and result.get("id"):
+                    server_references[key] = f"{resource['resourceType']}/{result['id']}"
+        
+        return created
+    
+    async def _transaction_unsupported(self, response: aiohttp.ClientResponse) -> bool:
+        """Whether an error response rejects the transaction interaction itself"""
+        if response.status in (405, 501):
+            return True
+        if response.status != 400:
+            return False
+        
+        try:
+            outcome = await response.json(loads=orjson.loads, content_type=None)
+        except ValueError:
+            return False
+        return any(
+            issue.get("code") == "not-supported"
+            for issue in (outcome or {}).get("issue", [])
+        )
+    
+    def validate_resource(self, resource: Dict[str, Any]) -> List[str]:
+        """Problems that would make a FHIR server reject the resource; empty if none"""
+        resource_type = resource.get("resourceType")
+        if resource_type not in _REQUIRED_ELEMENTS:
+            return [f"Unsupported resource type: {resource_type}"]
+        
+        errors = [
+            f"{resource_type}.{element} is required"
+            for element in _REQUIRED_ELEMENTS[resource_type]
+            if not resource.get(element)
+        ]
+        for element, allowed in _CODED_ELEMENTS[resource_type].items():
+            value = resource.get(element)
+            if value is not None and value not in allowed:
+                errors.append(f"{resource_type}.{element} has invalid code {value!r}")
+        return errors
+    
     def _map_encounter_class(self, encounter_type: str) -> str:
         """Map internal encounter type to FHIR class codes"""
-        mapping = {
-            "outpatient": "AMB",
-            "inpatient": "IMP",
-            "emergency": "EMER",
-            "virtual": "VR"
-        }
-        return mapping.get(encounter_type, "AMB")
+        return _ENCOUNTER_CLASSES.get(encounter_type, "AMB")
+    
+    def _map_encounter_status(self, status: Optional[str]) -> str:
+        """Map internal encounter status to FHIR encounter-status codes"""
+        return _ENCOUNTER_STATUSES.get(status or "active", "unknown")
     
     def _get_vital_unit(self, vital_type: str) -> str:
         """Get unit for vital sign"""
-        units = {
-            "temperature": "Cel",
-            "heart_rate": "/min",
-            "blood_pressure_systolic": "mm[Hg]",
-            "blood_pressure_diastolic": "mm[Hg]",
-            "respiratory_rate": "/min",
-            "oxygen_saturation": "%"
-        }
-        return units.get(vital_type, "")
+        return _VITAL_UNITS.get(vital_type, "")
 
 class HIEConnector:
     """Health Information Exchange connector"""
     
     def __init__(self):
         self.hie_endpoints = settings.hie_endpoints or {}
+        self._cached_query = async_ttl_cache(HIE_CACHE_SIZE, HIE_CACHE_TTL)(self._query_hie_endpoint)
     
     async def query_patient_data(self, patient_mrn: str) -> Dict[str, Any]:
         """Query external HIE for patient data"""
@@ -237,14 +511,18 @@ class HIEConnector:
             "lab_results": []
         }
         
-        # Query each connected HIE
-        for hie_name, endpoint in self.hie_endpoints.items():
-            try:
-                hie_data = await self._query_hie_endpoint(endpoint, patient_mrn)
-                if hie_data:
-                    results = self._merge_hie_data(results, hie_data)
-            except Exception as e:
-                logger.error(f"Error querying HIE {hie_name}: {str(e)}")
+        # Query every connected HIE at once; concurrent lookups of the same
+        # MRN share one request per endpoint
+        responses = await asyncio.gather(
+            *(self._cached_query(endpoint, patient_mrn) for endpoint in self.hie_endpoints.values()),
+            return_exceptions=True
+        )
+        
+        for hie_name, hie_data in zip(self.hie_endpoints, responses):
+            if isinstance(hie_data, Exception):
+                logger.error(f"Error querying HIE {hie_name}: {str(hie_data)}")
+            elif hie_data:
+                results = self._merge_hie_data(results, hie_data)
         
         return results
     
@@ -267,12 +545,20 @@ class ClinicalDataExchange:
         self.fhir_service = FHIRService()
         self.hie_connector = HIEConnector()
     
-    async def export_patient_summary(self, patient_id: str, db) -> Dict[str, Any]:
+    async def close(self):
+        """Release outbound connections; call on application shutdown"""
+        await self.fhir_service.close()
+    
+    async def export_patient_summary(self, patient_id: str, db: AsyncSession) -> Dict[str, Any]:
         """Export comprehensive patient summary in FHIR format"""
-        from sqlalchemy.orm import Session
-        
-        # Get patient data
-        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        # Get patient data with its encounters loaded up front (one IN query);
+        # anything else the resource builders touch raises instead of
+        # lazily loading per encounter
+        patient = await db.get(
+            Patient, patient_id,
+            options=[selectinload(Patient.encounters), raiseload("*")],
+            populate_existing=True
+        )
         if not patient:
             raise ValueError("Patient not found")
         
@@ -286,22 +572,50 @@ class ClinicalDataExchange:
         }
         
         # Add patient resource
-        patient_resource = await self.fhir_service.create_patient_resource(patient)
+        patient_resource = self.fhir_service.create_patient_resource(patient)
         bundle["entry"].append({
             "resource": patient_resource
         })
         
         # Add encounters
-        encounters = db.query(Encounter).filter(Encounter.patient_id == patient_id).all()
-        for encounter in encounters:
-            encounter_resource = await self.fhir_service.create_encounter_resource(encounter)
-            bundle["entry"].append({
-                "resource": encounter_resource
-            })
+        bundle["entry"].extend(
+            {"resource": self.fhir_service.create_encounter_resource(encounter)}
+            for encounter in patient.encounters
+        )
         
         return bundle
     
-    async def import_external_data(self, patient_mrn: str, db) -> Dict[str, Any]:
+    async def stream_patient_summary_ndjson(self, patient_id: str, db: AsyncSession) -> AsyncIterator[bytes]:
+        """Patient summary resources as FHIR NDJSON, one resource per line
+        
+        The bulk-export counterpart of export_patient_summary: encounters come
+        off a server-side cursor and are serialized chunk by chunk, so memory
+        stays bounded however long the patient's history is and the first
+        bytes go out before the last encounter is read.
+        """
+        patient = await db.get(Patient, patient_id)
+        if not patient:
+            raise ValueError("Patient not found")
+        
+        yield orjson.dumps(self.fhir_service.create_patient_resource(patient)) + b"\n"
+        
+        result = await db.stream_scalars(
+            select(Encounter)
+            .where(Encounter.patient_id == patient_id)
+            .execution_options(yield_per=FHIR_EXPORT_CHUNK_SIZE)
+        )
+        async for encounters in result.partitions():
+            yield b"".join(
+                orjson.dumps(self.fhir_service.create_encounter_resource(encounter)) + b"\n"
+                for encounter in encounters
+            )
+    
+    async def submit_patient_summary(self, patient_id: str, db: AsyncSession) -> Optional[Dict[str, Any]]:
+        """Export a patient summary and send it to the FHIR server in one request"""
+        bundle = await self.export_patient_summary(patient_id, db)
+        return await self.fhir_service.send_bundle(bundle)
+    
+    async def import_external_data(self, patient_mrn: str, db: AsyncSession) -> Dict[str, Any]:
         """Import patient data from external HIEs"""
         external_data = await self.hie_connector.query_patient_data(patient_mrn)
         
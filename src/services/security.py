@@ -2,42 +2,142 @@
 Enterprise Security Services
 Johns Hopkins Healthcare Security Standards
 """
+import asyncio
+import base64
 import hashlib
+import os
 import secrets
+import time
 import jwt
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, FrozenSet, List
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import logging
-from sqlalchemy.orm import Session
+import re
+import numpy as np
+from sqlalchemy import select, func, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # Numba is optional; passwords are then scanned as str
+    NUMBA_AVAILABLE = False
+
+from src.config.database import AsyncSessionLocal
 from src.config.settings import get_settings
 from src.models.auth import User, AuditLog, SecurityEvent
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Weak fragments rejected anywhere in a password, matched in one regex pass
+_COMMON_PASSWORD_PATTERNS = (
+    "123456", "password", "qwerty", "admin", "letmein",
+    "welcome", "monkey", "dragon", "master", "shadow"
+)
+_COMMON_PASSWORD_RE = re.compile("|".join(map(re.escape, _COMMON_PASSWORD_PATTERNS)))
+
+# Salts from before binary salts were 64 hex characters whose text (not the
+# decoded bytes) was fed to PBKDF2; new salts are base64 of 32 random bytes
+_LEGACY_SALT_RE = re.compile(r"[0-9a-f]{64}")
+PASSWORD_SALT_BYTES = 32
+
+_PASSWORD_SPECIALS = frozenset("!@#$%^&*()_+-=[]{}|;:,.<>?")
+
+# Character classes found by _scan_password, one bit each, and the special
+# characters as a lookup table over ASCII byte values
+_HAS_UPPER = 1
+_HAS_LOWER = 2
+_HAS_DIGIT = 4
+_HAS_SPECIAL = 8
+_SPECIAL_BYTES = np.zeros(128, dtype=np.bool_)
+_SPECIAL_BYTES[list("".join(_PASSWORD_SPECIALS).encode("ascii"))] = True
+
+# PII ciphertexts with this prefix are AES-256-GCM (nonce + ciphertext + tag,
+# urlsafe base64); anything else is a legacy Fernet token
+_PII_AESGCM_PREFIX = "g1:"
+_PII_NONCE_SIZE = 12
+
+# Background audit writer: most entries per INSERT, and seconds to wait for
+# a batch to fill before writing what has arrived
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.1
+# Entries queued before callers write inline instead (backpressure rather
+# than unbounded memory), first and longest seconds between retries of a
+# failed batch, and how long shutdown waits for the queue to drain
+AUDIT_QUEUE_SIZE = 10_000
+AUDIT_RETRY_DELAY = 0.5
+AUDIT_RETRY_MAX_DELAY = 30
+AUDIT_SHUTDOWN_TIMEOUT = 30
+# Set AUDIT_BATCH_WRITES=false to keep committing every entry inline, e.g.
+# where an access must be durable before the request returns
+AUDIT_BATCH_WRITES = os.getenv("AUDIT_BATCH_WRITES", "true").lower() == "true"
+
+# Seconds a cached UTC time is reused as "now" for rate-window filters
+COARSE_CLOCK_RESOLUTION = 0.1
+
+# (monotonic time read, UTC datetime at that moment)
+_coarse_now = (float("-inf"), datetime.min)
+
+def _coarse_utcnow() -> datetime:
+    """UTC now to within COARSE_CLOCK_RESOLUTION seconds
+    
+    For window cutoffs like "the last 15 minutes", where 100ms of slack does
+    not matter; a datetime is built at most once per resolution interval
+    rather than on every event. Timestamps stored on records still use
+    datetime.utcnow().
+    """
+    global _coarse_now
+    
+    read_at = time.monotonic()
+    if read_at - _coarse_now[0] >= COARSE_CLOCK_RESOLUTION:
+        _coarse_now = (read_at, datetime.utcnow())
+    return _coarse_now[1]
+
 class SecurityManager:
     """Enterprise security management"""
     
     def __init__(self):
         self.encryption_key = settings.encryption_key.encode()
         self.fernet = Fernet(self.encryption_key)
+        # AES-GCM encrypts and authenticates in one AES-NI pass; its key is
+        # derived from the configured Fernet key so no new secret is needed
+        self._aead = AESGCM(HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"medflow-pii-aes-256-gcm"
+        ).derive(base64.urlsafe_b64decode(self.encryption_key)))
         self.jwt_secret = settings.jwt_secret
         self.password_policy = PasswordPolicy()
-        self.audit_logger = AuditLogger()
+        # The shared module instance, so starting its writer covers every caller
+        self.audit_logger = audit_logger
     
     def encrypt_pii(self, data: str) -> str:
         """Encrypt personally identifiable information"""
         if not data:
             return data
-        return self.fernet.encrypt(data.encode()).decode()
+        nonce = os.urandom(_PII_NONCE_SIZE)
+        ciphertext = self._aead.encrypt(nonce, data.encode(), None)
+        return _PII_AESGCM_PREFIX + base64.urlsafe_b64encode(nonce + ciphertext).decode()
     
     def decrypt_pii(self, encrypted_data: str) -> str:
-        """Decrypt personally identifiable information"""
+        """Decrypt personally identifiable information
+        
+        Values written before the switch to AES-GCM are Fernet tokens and are
+        still readable; they are re-encrypted whenever the field is saved.
+        """
         if not encrypted_data:
             return encrypted_data
         try:
+            if encrypted_data.startswith(_PII_AESGCM_PREFIX):
+                raw = base64.urlsafe_b64decode(encrypted_data[len(_PII_AESGCM_PREFIX):])
+                return self._aead.decrypt(raw[:_PII_NONCE_SIZE], raw[_PII_NONCE_SIZE:], None).decode()
             return self.fernet.decrypt(encrypted_data.encode()).decode()
         except Exception as e:
             logger.error(f"Decryption error: {str(e)}")
@@ -46,13 +146,18 @@ class SecurityManager:
     def hash_password(self, password: str, salt: Optional[str] = None) -> tuple[str, str]:
         """Hash password with salt using PBKDF2"""
         if not salt:
-            salt = secrets.token_hex(32)
+            salt_bytes = secrets.token_bytes(PASSWORD_SALT_BYTES)
+            salt = base64.b64encode(salt_bytes).decode()
+        elif _LEGACY_SALT_RE.fullmatch(salt):
+            salt_bytes = salt.encode()
+        else:
+            salt_bytes = base64.b64decode(salt)
         
         # Use PBKDF2 with SHA-256 (NIST recommended)
         password_hash = hashlib.pbkdf2_hmac(
             'sha256',
             password.encode('utf-8'),
-            salt.encode('utf-8'),
+            salt_bytes,
             100000  # 100,000 iterations
         )
         
@@ -63,6 +168,19 @@ class SecurityManager:
         password_hash, _ = self.hash_password(password, salt)
         return secrets.compare_digest(password_hash, hashed_password)
     
+    async def ahash_password(self, password: str, salt: Optional[str] = None) -> tuple[str, str]:
+        """hash_password in a worker thread, for use from async code
+        
+        The key derivation is deliberately slow; OpenSSL releases the GIL, so
+        concurrent logins hash in parallel while the event loop keeps serving
+        requests.
+        """
+        return await asyncio.to_thread(self.hash_password, password, salt)
+    
+    async def averify_password(self, password: str, hashed_password: str, salt: str) -> bool:
+        """verify_password in a worker thread, for use from async code"""
+        return await asyncio.to_thread(self.verify_password, password, hashed_password, salt)
+    
     def create_access_token(self, user_id: str, permissions: List[str]) -> str:
         """Create JWT access token with permissions"""
         payload = {
@@ -94,7 +212,7 @@ class SecurityManager:
             logger.warning(f"Invalid token: {str(e)}")
             return None
     
-    async def log_security_event(self, event_type: str, user_id: str, details: Dict[str, Any], db: Session):
+    async def log_security_event(self, event_type: str, user_id: str, details: Dict[str, Any], db: AsyncSession):
         """Log security events for monitoring"""
         security_event = SecurityEvent(
             event_type=event_type,
@@ -106,36 +224,44 @@ class SecurityManager:
         )
         
         db.add(security_event)
-        db.commit()
+        await db.commit()
         
         # Check for suspicious patterns
         await self._analyze_security_patterns(user_id, event_type, db)
     
-    async def _analyze_security_patterns(self, user_id: str, event_type: str, db: Session):
+    async def _analyze_security_patterns(self, user_id: str, event_type: str, db: AsyncSession):
         """Analyze security events for suspicious patterns"""
         # Check for multiple failed logins
         if event_type == "login_failed":
-            recent_failures = db.query(SecurityEvent).filter(
-                SecurityEvent.user_id == user_id,
-                SecurityEvent.event_type == "login_failed",
-                SecurityEvent.timestamp >= datetime.utcnow() - timedelta(minutes=15)
-            ).count()
-            
-            if recent_failures >= 5:
+            if await self._reaches_threshold(user_id, "login_failed", timedelta(minutes=15), 5, db):
                 await self._trigger_security_alert("multiple_failed_logins", user_id, db)
         
         # Check for unusual access patterns
         if event_type == "data_access":
-            recent_access = db.query(SecurityEvent).filter(
-                SecurityEvent.user_id == user_id,
-                SecurityEvent.event_type == "data_access",
-                SecurityEvent.timestamp >= datetime.utcnow() - timedelta(hours=1)
-            ).count()
-            
-            if recent_access >= 100:  # Unusual volume
+            # Unusual volume
+            if await self._reaches_threshold(user_id, "data_access", timedelta(hours=1), 100, db):
                 await self._trigger_security_alert("unusual_access_pattern", user_id, db)
     
-    async def _trigger_security_alert(self, alert_type: str, user_id: str, db: Session):
+    async def _reaches_threshold(self, user_id: str, event_type: str, window: timedelta,
+                                 threshold: int, db: AsyncSession) -> bool:
+        """Whether the user logged at least threshold events of a type within window
+        
+        Counts over a LIMIT threshold subquery, so at most threshold rows are
+        read however many events actually match.
+        """
+        matching = (
+            select(SecurityEvent.id)
+            .where(
+                SecurityEvent.user_id == user_id,
+                SecurityEvent.event_type == event_type,
+                SecurityEvent.timestamp >= _coarse_utcnow() - window
+            )
+            .limit(threshold)
+            .subquery()
+        )
+        return await db.scalar(select(func.count()).select_from(matching)) >= threshold
+    
+    async def _trigger_security_alert(self, alert_type: str, user_id: str, db: AsyncSession):
         """Trigger security alert and response"""
         logger.critical(f"SECURITY ALERT: {alert_type} for user {user_id}")
         
@@ -149,7 +275,7 @@ class SecurityManager:
         )
         
         db.add(security_event)
-        db.commit()
+        await db.commit()
 
 class PasswordPolicy:
     """Enterprise password policy enforcement"""
@@ -170,16 +296,18 @@ class PasswordPolicy:
         if len(password) < self.min_length:
             errors.append(f"Password must be at least {self.min_length} characters")
         
-        if self.require_uppercase and not any(c.isupper() for c in password):
+        has_upper, has_lower, has_digit, has_special = self._character_classes(password)
+        
+        if self.require_uppercase and not has_upper:
             errors.append("Password must contain uppercase letters")
         
-        if self.require_lowercase and not any(c.islower() for c in password):
+        if self.require_lowercase and not has_lower:
             errors.append("Password must contain lowercase letters")
         
-        if self.require_numbers and not any(c.isdigit() for c in password):
+        if self.require_numbers and not has_digit:
             errors.append("Password must contain numbers")
         
-        if self.require_special and not any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password):
+        if self.require_special and not has_special:
             errors.append("Password must contain special characters")
         
         # Check for common patterns
@@ -188,38 +316,192 @@ class PasswordPolicy:
         
         return len(errors) == 0, errors
     
+    def _character_classes(self, password: str) -> tuple[bool, bool, bool, bool]:
+        """Whether the password has uppercase, lowercase, digit and special characters
+        
+        One pass over the password, stopping once all four have been seen.
+        ASCII passwords are scanned as bytes by a compiled kernel when Numba
+        is installed.
+        """
+        if NUMBA_AVAILABLE and password.isascii():
+            found = _scan_password(np.frombuffer(password.encode("ascii"), dtype=np.uint8), _SPECIAL_BYTES)
+            return (
+                bool(found & _HAS_UPPER), bool(found & _HAS_LOWER),
+                bool(found & _HAS_DIGIT), bool(found & _HAS_SPECIAL)
+            )
+        
+        has_upper = has_lower = has_digit = has_special = False
+        for c in password:
+            if c.isupper():
+                has_upper = True
+            elif c.islower():
+                has_lower = True
+            elif c.isdigit():
+                has_digit = True
+            elif c in _PASSWORD_SPECIALS:
+                has_special = True
+            else:
+                continue
+            if has_upper and has_lower and has_digit and has_special:
+                break
+        return has_upper, has_lower, has_digit, has_special
+    
     def _contains_common_patterns(self, password: str) -> bool:
         """Check for common password patterns"""
-        common_patterns = [
-            "123456", "password", "qwerty", "admin", "letmein",
-            "welcome", "monkey", "dragon", "master", "shadow"
-        ]
-        
-        password_lower = password.lower()
-        return any(pattern in password_lower for pattern in common_patterns)
+        return _COMMON_PASSWORD_RE.search(password.lower()) is not None
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _scan_password(buf, specials):
+        """Bitmask of the character classes present in an ASCII password"""
+        found = 0
+        for byte in buf:
+            if 65 <= byte <= 90:
+                found |= _HAS_UPPER
+            elif 97 <= byte <= 122:
+                found |= _HAS_LOWER
+            elif 48 <= byte <= 57:
+                found |= _HAS_DIGIT
+            elif specials[byte]:
+                found |= _HAS_SPECIAL
+            if found == 15:
+                break
+        return found
 
 class AuditLogger:
     """Comprehensive audit logging for compliance"""
     
     def __init__(self):
         self.logger = logging.getLogger("audit")
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+    
+    def start(self):
+        """Write audit entries from a background task in batches; call on startup
+        
+        Until started, every entry is committed inline on the caller's session.
+        Once started, an entry is acknowledged before it is durable: entries
+        still queued are lost if the process crashes, though stop() flushes
+        them on a clean shutdown. Failed batches are retried until written,
+        and a full queue makes callers write inline. Leave it unstarted
+        where every access must be committed before the request returns.
+        """
+        if self._writer is None:
+            self._queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+            self._writer = asyncio.create_task(self._write_batches())
+    
+    async def stop(self):
+        """Flush queued entries and stop the writer; call on shutdown
+        
+        Entries still unwritten after AUDIT_SHUTDOWN_TIMEOUT (the database
+        being down) go to the audit log stream in full as a last resort.
+        """
+        if self._writer is None:
+            return
+        
+        try:
+            await asyncio.wait_for(self._queue.join(), AUDIT_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        
+        unwritten = self._batch + [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        if unwritten:
+            self.logger.error(f"Audit database unavailable at shutdown; {len(unwritten)} entries not written: {unwritten}")
+        self._queue = self._writer = None
+        self._batch = []
+    
+    async def _record(self, entry: Dict[str, Any], db: AsyncSession):
+        """Queue an audit row for the background writer, or commit it inline"""
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(entry)
+                return
+            except asyncio.QueueFull:
+                self.logger.warning("Audit queue full, writing entry inline")
+        
+        db.add(AuditLog(**entry))
+        await db.commit()
+    
+    async def _write_batches(self):
+        """Drain the queue, inserting up to AUDIT_BATCH_SIZE rows per statement"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            
+            self._batch = batch
+            dequeued = len(batch)
+            delay = AUDIT_RETRY_DELAY
+            while not await self._write_batch(batch):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, AUDIT_RETRY_MAX_DELAY)
+            self._batch = []
+            for _ in range(dequeued):
+                self._queue.task_done()
+    
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of audit entries; False if it should be retried
+        
+        Entries are grouped by key set, as one executemany needs the same
+        columns in every row. A batch rejected for its data is written entry
+        by entry, since retrying it whole cannot succeed. Entries written
+        before a retryable failure are removed from batch.
+        """
+        groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+        for entry in batch:
+            groups.setdefault(frozenset(entry), []).append(entry)
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                for entries in groups.values():
+                    await db.execute(insert(AuditLog), entries)
+                await db.commit()
+            return True
+        except (IntegrityError, DataError):
+            self.logger.exception(f"Audit batch rejected, writing {len(batch)} entries individually")
+        except Exception:
+            self.logger.exception(f"Failed to write {len(batch)} audit entries, retrying")
+            return False
+        
+        for index, entry in enumerate(batch):
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(AuditLog), entry)
+                    await db.commit()
+            except (IntegrityError, DataError):
+                self.logger.exception(f"Audit entry rejected by the database: {entry}")
+            except Exception:
+                # Entries before this one are committed; retry from here
+                self.logger.exception("Failed to write audit entry, retrying")
+                del batch[:index]
+                return False
+        return True
     
     async def log_data_access(self, user_id: str, resource_type: str, resource_id: str, 
-                            action: str, db: Session, **kwargs):
+                            action: str, db: AsyncSession, **kwargs):
         """Log data access for HIPAA compliance"""
-        audit_entry = AuditLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            timestamp=datetime.utcnow(),
-            ip_address=kwargs.get("ip_address"),
-            user_agent=kwargs.get("user_agent"),
-            session_id=kwargs.get("session_id")
-        )
-        
-        db.add(audit_entry)
-        db.commit()
+        timestamp = datetime.utcnow()
+        await self._record({
+            "user_id": user_id,
+            "action": action,
+            "resource_type": resource_type,
+            "resource_id": resource_id,
+            "timestamp": timestamp,
+            "ip_address": kwargs.get("ip_address"),
+            "user_agent": kwargs.get("user_agent"),
+            "session_id": kwargs.get("session_id")
+        }, db)
         
         # Also log to external audit system
         self.logger.info(
@@ -229,32 +511,39 @@ class AuditLogger:
                 "action": action,
                 "resource_type": resource_type,
                 "resource_id": resource_id,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": timestamp.isoformat(),
                 **kwargs
             }
         )
     
-    async def log_system_event(self, event_type: str, details: Dict[str, Any], db: Session):
+    async def log_system_event(self, event_type: str, details: Dict[str, Any], db: AsyncSession):
         """Log system events"""
-        audit_entry = AuditLog(
-            action=event_type,
-            resource_type="system",
-            details=details,
-            timestamp=datetime.utcnow()
-        )
-        
-        db.add(audit_entry)
-        db.commit()
+        await self._record({
+            "action": event_type,
+            "resource_type": "system",
+            "details": details,
+            "timestamp": datetime.utcnow()
+        }, db)
 
 class AccessControl:
     """Role-based access control with fine-grained permissions"""
     
     def __init__(self):
         self.permissions = self._load_permission_matrix()
+        # Every (role, permission) grant, so a check is one hashed lookup
+        self._grants = frozenset(
+            (role, permission)
+            for role, permissions in self.permissions.items()
+            for permission in permissions
+        )
     
-    def _load_permission_matrix(self) -> Dict[str, List[str]]:
-        """Load role-based permission matrix"""
-        return {
+    def _load_permission_matrix(self) -> Dict[str, FrozenSet[str]]:
+        """Load role-based permission matrix
+        
+        Each role maps to a frozenset so permission checks, which run on
+        every authorized request, are a hash lookup rather than a list scan.
+        """
+        matrix = {
             "physician": [
                 "patient:read", "patient:write", "patient:create",
                 "encounter:read", "encounter:write", "encounter:create",
@@ -286,17 +575,17 @@ class AccessControl:
                 "system:configure", "audit:read", "report:generate"
             ]
         }
+        return {role: frozenset(permissions) for role, permissions in matrix.items()}
     
     def check_permission(self, user_role: str, required_permission: str) -> bool:
         """Check if user role has required permission"""
-        user_permissions = self.permissions.get(user_role, [])
-        return required_permission in user_permissions
+        return (user_role, required_permission) in self._grants
     
     def get_user_permissions(self, user_role: str) -> List[str]:
         """Get all permissions for user role"""
-        return self.permissions.get(user_role, [])
+        return sorted(self.permissions.get(user_role, ()))
 
-# Global instances
+# Global instances; audit_logger first, as SecurityManager shares it
+audit_logger = AuditLogger()
 security_manager = SecurityManager()
-access_control = AccessControl()
-audit_logger = AuditLogger()
\ No newline at end of file
+access_control = AccessControl()
\ No newline at end of file
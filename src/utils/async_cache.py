@@ -0,0 +1,52 @@
+"""
+Async Memoization
+In-process TTL cache for coroutine functions backed by slow external services
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+import asyncio
+import functools
+import time
+
+T = TypeVar("T")
+
+def async_ttl_cache(maxsize: int = 1024, ttl: float = 300) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Memoize an async function per positional arguments for ttl seconds
+    
+    Least recently used entries are evicted beyond maxsize. Concurrent calls
+    with the same arguments share one in-flight call, and failures are not
+    cached. Arguments must be hashable.
+    """
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        in_flight: Dict[Hashable, asyncio.Future] = {}
+        
+        def store(key: Hashable, task: asyncio.Future):
+            in_flight.pop(key, None)
+            if task.cancelled() or task.exception() is not None:
+                return
+            entries[key] = (time.monotonic(), task.result())
+            entries.move_to_end(key)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+        
+        @functools.wraps(func)
+        async def wrapper(*args: Hashable) -> T:
+            entry = entries.get(args)
+            if entry and time.monotonic() - entry[0] < ttl:
+                entries.move_to_end(args)
+                return entry[1]
+            
+            task = in_flight.get(args)
+            if task is None:
+                task = asyncio.ensure_future(func(*args))
+                in_flight[args] = task
+                task.add_done_callback(functools.partial(store, args))
+            
+            # Shielded so one cancelled caller does not cancel the shared call
+            return await asyncio.shield(task)
+        
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    
+    return decorator
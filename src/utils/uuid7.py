@@ -0,0 +1,21 @@
+"""
+Time-Ordered Identifiers
+RFC 9562 UUIDv7 primary keys: new rows append at the right edge of the index
+"""
+import os
+import time
+import uuid
+
+def _uuid7() -> uuid.UUID:
+    """48-bit Unix millisecond timestamp, version 7, then 74 random bits"""
+    unix_ms = time.time_ns() // 1_000_000
+    value = (unix_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76  # version
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122/9562 variant
+    return uuid.UUID(int=value)
+
+try:
+    # uuid-utils is optional; its Rust generator is faster and returns stdlib UUIDs
+    from uuid_utils.compat import uuid7
+except ImportError:
+    uuid7 = getattr(uuid, "uuid7", _uuid7)
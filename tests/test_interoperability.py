@@ -0,0 +1,40 @@
+"""
+FHIR resource construction and local validation
+"""
+from datetime import datetime
+import uuid
+
+import pytest
+
+from src.models.clinical import Encounter
+from src.services.interoperability import FHIRService
+
+def _encounter(**overrides) -> Encounter:
+    fields = {
+        "id": uuid.uuid4(),
+        "patient_id": uuid.uuid4(),
+        "provider_id": uuid.uuid4(),
+        "encounter_type": "outpatient",
+        "start_time": datetime(2024, 1, 1, 9, 30)
+    }
+    fields.update(overrides)
+    return Encounter(**fields)
+
+def test_default_status_encounter_is_valid():
+    service = FHIRService()
+    resource = service.create_encounter_resource(_encounter())
+    
+    assert resource["status"] == "in-progress"
+    assert service.validate_resource(resource) == []
+
+@pytest.mark.parametrize("status, fhir_status", [
+    ("active", "in-progress"),
+    ("completed", "finished"),
+    ("cancelled", "cancelled")
+])
+def test_internal_encounter_statuses_map_to_fhir_codes(status, fhir_status):
+    service = FHIRService()
+    resource = service.create_encounter_resource(_encounter(status=status))
+    
+    assert resource["status"] == fhir_status
+    assert service.validate_resource(resource) == []